@@ -0,0 +1,273 @@
+import os
+import sys
+import csv
+import glob
+import json
+import argparse
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from digikey import DigiKeyClient, parse_product_result, ADAPTIVE_ENABLED, ADAPTIVE_MAX
+from write_excel import read_excel_data, write_multiple_columns
+from main import build_columns_data
+from result_stream import ResultStreamWriter
+from history import append_run
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'main_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('batch_processor')
+logger.setLevel(logging.DEBUG)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.DEBUG)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+
+def file_key(path):
+    """同一文件的不同写法（a.xlsx、./a.xlsx、符号链接等）得到相同的键"""
+    return os.path.normcase(os.path.realpath(path))
+
+
+def expand_paths(patterns):
+    """展开文件路径和通配符，跳过Excel临时锁文件"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning(f"没有匹配的文件: {pattern}")
+        for path in matches:
+            if os.path.basename(path).startswith('~$'):
+                continue
+            if file_key(path) not in seen:
+                seen.add(file_key(path))
+                paths.append(path)
+    return paths
+
+
+def load_manifest(manifest_path):
+    """
+    读取任务清单（JSON列表或CSV），每项包含 file, sheet, column, output_column（可选）
+    file 字段支持通配符
+    """
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    targets = []
+    for entry in entries:
+        if not entry.get('file') or not entry.get('sheet') or not entry.get('column'):
+            raise ValueError(f"清单条目缺少 file/sheet/column 字段: {entry}")
+        for path in expand_paths([entry['file']]):
+            targets.append({
+                'file': path,
+                'sheet': entry['sheet'],
+                'column': entry['column'],
+                'output_column': entry.get('output_column') or f"{entry['column']}_状态"
+            })
+    return targets
+
+
+def read_target(target):
+    """读取单个目标工作表的产品编号（在子进程中执行）"""
+    data, header_row, _ = read_excel_data(target['file'], target['sheet'], target['column'], return_header_info=True)
+    return data, header_row
+
+
+def write_file_targets(path, targets, results):
+    """
+    将结果写回同一文件的所有目标工作表（在子进程中执行）
+    同一文件的多个工作表顺序写入，避免并发保存同一个工作簿
+    """
+    messages = []
+    for target in targets:
+        columns_data = build_columns_data(results, target['data'], target['output_column'])
+        write_result = write_multiple_columns(path, target['sheet'], columns_data, max_search_rows=10,
+                                              reference_header=target['column'], reference_header_row=target['header_row'])
+        if write_result.get('status') == 'error':
+            return {'status': 'error', 'message': f"{path} [{target['sheet']}]: {write_result.get('message')}"}
+        messages.append(target['sheet'])
+    return {'status': 'success', 'message': f"{path}: 已写入工作表 {', '.join(messages)}"}
+
+
+def lookup_all(product_numbers, workers, stream=None, hedge=None, archive_path=None, archive_mode=None):
+    """
+    对去重后的产品编号进行一次合并查询
+    :param stream: 可选的 ResultStreamWriter，每完成一个查询即写入
+    :param hedge: 是否启用对冲请求（默认由 DIGIKEY_HEDGE 决定）
+    :param archive_path: 响应归档文件，archive_mode 为 record（录制）或 replay（回放，不访问网络）
+    """
+    client = DigiKeyClient(hedge=hedge, archive_path=archive_path, archive_mode=archive_mode)
+    results = {}
+    total = len(product_numbers)
+    success_count = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(client.get_product_details, p): p for p in product_numbers}
+        for i, future in enumerate(as_completed(futures), 1):
+            product_number = futures[future]
+            try:
+                details = future.result()
+            except Exception as e:
+                logger.error(f"产品 {product_number} 查询异常: {e}")
+                details = None
+            success, results[product_number] = parse_product_result(details)
+            success_count += success
+            if stream:
+                stream.write(product_number, results[product_number])
+
+            sys.stdout.write(f"\r查询进度: {i}/{total} ({i / total * 100:.1f}%)")
+            sys.stdout.flush()
+
+    print()
+    logger.info(f"查询完成！成功: {success_count}, 失败: {total - success_count}")
+    if client.limiter:
+        logger.info(f"自适应并发上限: {client.concurrency_limit()}")
+    if client.hedge:
+        stats = client.hedge_stats()
+        logger.info(f"对冲请求: {stats['hedges']}/{stats['requests']}")
+    return results
+
+
+def run_batch(targets, lookup_workers=4, write_workers=None, json_output=None, hedge=None,
+              archive_path=None, archive_mode=None):
+    """
+    批量处理多个工作簿：读取 -> 跨文件去重 -> 合并查询 -> 并行写回
+    :return: 处理结果字典
+    """
+    if not targets:
+        return {'status': 'error', 'message': '没有需要处理的文件'}
+
+    with ProcessPoolExecutor(max_workers=write_workers) as pool:
+        # 并行读取所有目标
+        failed = []
+        futures = {pool.submit(read_target, target): target for target in targets}
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                target['data'], target['header_row'] = future.result()
+            except Exception as e:
+                logger.error(f"读取失败 {target['file']} [{target['sheet']}]: {e}")
+                failed.append(f"{target['file']} [{target['sheet']}]")
+        targets = [t for t in targets if t.get('data')]
+
+        # 跨文件去重，保持首次出现的顺序
+        product_numbers = list(dict.fromkeys(p for t in targets for p in t['data']))
+        row_count = sum(len(t['data']) for t in targets)
+        logger.info(f"共 {len(targets)} 个工作表, {row_count} 行, 去重后 {len(product_numbers)} 个产品编号")
+        if not product_numbers:
+            return {'status': 'error', 'message': '未获取到有效的产品数据'}
+
+        # .ndjson / .ndjson.gz 输出随查询逐条写入，其他扩展名写出旧版JSON格式
+        if json_output and json_output.endswith(('.ndjson', '.ndjson.gz')):
+            with ResultStreamWriter(json_output) as stream:
+                results = lookup_all(product_numbers, lookup_workers, stream, hedge, archive_path, archive_mode)
+        else:
+            results = lookup_all(product_numbers, lookup_workers, hedge=hedge,
+                                 archive_path=archive_path, archive_mode=archive_mode)
+            if json_output:
+                with open(json_output, 'w', encoding='utf-8') as f:
+                    json.dump(results, f, ensure_ascii=False, indent=2)
+        if json_output:
+            logger.info(f"结果已保存到 {json_output}")
+        # 回放归档的结果不是新的查询数据，不计入历史记录
+        if archive_mode != 'replay':
+            append_run(results.items(), 'batch')
+
+        # 按文件分组并行写回，只传递该文件用到的结果；同一文件的不同写法归为一组，避免多个进程同时保存
+        by_file = {}
+        for target in targets:
+            by_file.setdefault(file_key(target['file']), []).append(target)
+        futures = {}
+        for file_targets in by_file.values():
+            path = file_targets[0]['file']
+            file_results = {p: results[p] for t in file_targets for p in t['data']}
+            futures[pool.submit(write_file_targets, path, file_targets, file_results)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                write_result = future.result()
+            except Exception as e:
+                write_result = {'status': 'error', 'message': f"{path}: {e}"}
+            if write_result['status'] == 'error':
+                logger.error(f"写入失败 {write_result['message']}")
+                failed.append(path)
+            else:
+                logger.info(write_result['message'])
+
+    if failed:
+        return {'status': 'error', 'message': f"{len(failed)} 个文件处理失败: {', '.join(failed)}", 'data': results}
+    return {'status': 'success', 'message': f"成功处理 {len(by_file)} 个文件, {len(product_numbers)} 个产品", 'data': results}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='DigiKey 批量处理多个Excel文件（跨文件去重查询）')
+    parser.add_argument('files', nargs='*', help='Excel文件路径或通配符，例如 "boms/*.xlsx"')
+    parser.add_argument('-s', '--sheet', action='append', help='工作表名（可重复指定，应用于所有文件）')
+    parser.add_argument('-c', '--column', help='产品编号列名')
+    parser.add_argument('-o', '--output-column', help='输出列名（默认: <产品编号列名>_状态）')
+    parser.add_argument('-m', '--manifest', help='任务清单文件（JSON或CSV，字段: file, sheet, column, output_column）')
+    parser.add_argument('--lookup-workers', type=int, default=ADAPTIVE_MAX if ADAPTIVE_ENABLED else 4,
+                        help='查询线程数（启用自适应并发时为并发上限，默认 DIGIKEY_MAX_CONCURRENCY；否则默认4）')
+    parser.add_argument('--write-workers', type=int, help='并行读写Excel的进程数（默认CPU核数）')
+    parser.add_argument('--json-output', help='合并查询结果的输出路径（.ndjson/.ndjson.gz 逐条写入，其他为JSON）')
+    parser.add_argument('--hedge', action='store_true', default=None,
+                        help='慢请求超过近期延迟百分位时发送对冲请求（默认由 DIGIKEY_HEDGE 决定）')
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument('--record', metavar='ARCHIVE', help='将原始API响应录制到归档文件')
+    archive_group.add_argument('--replay', metavar='ARCHIVE', help='从归档文件回放响应，不访问网络（用于调整输出列后重新生成结果）')
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+
+    targets = []
+    if args.manifest:
+        targets.extend(load_manifest(args.manifest))
+    if args.files:
+        if not args.sheet or not args.column:
+            parser.error('指定文件时必须提供 --sheet 和 --column')
+        for path in expand_paths(args.files):
+            for sheet in args.sheet:
+                targets.append({
+                    'file': path,
+                    'sheet': sheet,
+                    'column': args.column,
+                    'output_column': args.output_column or f"{args.column}_状态"
+                })
+    if not targets:
+        parser.error('请指定要处理的文件或任务清单')
+
+    logger.info(f"启动批量处理: {len(targets)} 个目标")
+    if args.replay and not os.path.exists(args.replay):
+        parser.error(f'归档文件不存在: {args.replay}')
+    archive_path = args.record or args.replay
+    archive_mode = 'replay' if args.replay else ('record' if args.record else None)
+    result = run_batch(targets, args.lookup_workers, args.write_workers, args.json_output, args.hedge,
+                       archive_path, archive_mode)
+    logger.info(f"处理结果: {result['status']} - {result['message']}")
+    print(f"处理结果: {result['status']}")
+    print(f"消息: {result['message']}")
+    sys.exit(0 if result['status'] == 'success' else 1)
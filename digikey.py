@@ -1,9 +1,14 @@
 import os
+import json
 import requests
 import logging
+import threading
 from time import time
-from typing import Optional, Dict
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Tuple
 from datetime import datetime
+from response_archive import ResponseArchive, MODE_RECORD, MODE_REPLAY, MISSING
 
 # 配置日志
 log_dir = 'logs'
@@ -31,8 +36,220 @@ console_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
+# DigiKey API 地址（压力测试时可指向本地模拟服务）
+API_BASE = os.getenv('DIGIKEY_API_BASE', 'https://api.digikey.com').rstrip('/')
+# 令牌和查询请求的超时（秒）；请求令牌时持有跨进程的文件锁，不能无限等待
+REQUEST_TIMEOUT = 10
+
+# 令牌缓存文件路径，设置为空字符串可禁用文件缓存
+TOKEN_CACHE_FILE = os.getenv('DIGIKEY_TOKEN_CACHE', os.path.join(os.path.expanduser('~'), '.digikey', 'token_cache.json'))
+
+# 对冲请求：单次查询超过近期延迟的指定百分位时，再发一个相同请求，取先返回的结果
+HEDGE_ENABLED = os.getenv('DIGIKEY_HEDGE', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('DIGIKEY_HEDGE_PERCENTILE', '95'))
+# 对冲请求占总请求数的上限比例，避免浪费API配额
+HEDGE_BUDGET = float(os.getenv('DIGIKEY_HEDGE_BUDGET', '0.05'))
+# 延迟样本不足时不对冲
+HEDGE_MIN_SAMPLES = 20
+
+# 自适应并发（AIMD）：延迟和成功率正常时逐步增加并发，遇到限流、超时或延迟上升时成倍降低（默认关闭）
+ADAPTIVE_ENABLED = os.getenv('DIGIKEY_ADAPTIVE', '0') == '1'
+ADAPTIVE_INITIAL = int(os.getenv('DIGIKEY_INITIAL_CONCURRENCY', '4'))
+ADAPTIVE_MIN = int(os.getenv('DIGIKEY_MIN_CONCURRENCY', '1'))
+ADAPTIVE_MAX = int(os.getenv('DIGIKEY_MAX_CONCURRENCY', '16'))
+# 平滑延迟超过基准（近期平滑延迟的中位数）的倍数时视为延迟上升
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv('DIGIKEY_LATENCY_TOLERANCE', '2.0'))
+# 视为限流的HTTP状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+# 响应归档：record 模式录制原始响应，replay 模式只从归档返回（不发出网络请求）
+ARCHIVE_PATH = os.getenv('DIGIKEY_ARCHIVE', '')
+ARCHIVE_MODE = os.getenv('DIGIKEY_ARCHIVE_MODE', MODE_RECORD if ARCHIVE_PATH else '')
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TokenFileCache:
+    """
+    本机所有进程共享的访问令牌缓存文件
+    文件权限限制为仅当前用户可读写；刷新令牌时持有文件锁，保证同一时刻只有一个进程请求新令牌
+    缓存文件不可用（目录不可写等）时直接请求新令牌，不影响查询
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+    def _open_locked(self):
+        """打开并锁定锁文件，失败时返回None"""
+        lock_file = None
+        try:
+            cache_dir = os.path.dirname(self.path)
+            if cache_dir:
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            lock_file = os.fdopen(os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+            _lock_file(lock_file)
+            return lock_file
+        except OSError as e:
+            logger.warning(f"令牌缓存文件不可用，直接请求新令牌: {e}")
+            if lock_file:
+                lock_file.close()
+            return None
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: Dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def get_or_refresh(self, client_id: str, refresh) -> Dict:
+        """
+        返回缓存中仍然有效的令牌，否则调用 refresh() 获取新令牌并写入缓存
+        :param client_id: 客户端ID（同一文件可缓存多个客户端的令牌）
+        :param refresh: 返回 {'access_token', 'expires_at'} 的函数，其异常直接抛出
+        """
+        lock_file = self._open_locked()
+        if lock_file is None:
+            return refresh()
+        with lock_file:
+            try:
+                data = self._read()
+                cached = data.get(client_id)
+                if cached and cached.get('access_token') and time() < cached.get('expires_at', 0):
+                    return cached
+
+                token_cache = refresh()
+                data = {k: v for k, v in data.items() if time() < v.get('expires_at', 0)}
+                data[client_id] = token_cache
+                try:
+                    self._write(data)
+                except OSError as e:
+                    logger.warning(f"写入令牌缓存文件失败: {e}")
+                return token_cache
+            finally:
+                _unlock_file(lock_file)
+
+
+class LatencyTracker:
+    """记录最近请求的延迟（秒），用于计算对冲阈值"""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回第p百分位的延迟，样本不足时返回None"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD并发控制器
+
+    每个请求完成后反馈延迟和是否被限流：正常时每个"窗口"（约等于当前并发数个请求）并发上限加1；
+    被限流（429/503）、超时或平滑延迟超过基准延迟的 ADAPTIVE_LATENCY_TOLERANCE 倍时，上限减半（延迟上升时乘0.9）。
+    基准取近期平滑延迟的中位数（同为平滑值才可比较；单次延迟的低分位数在长尾分布下远低于均值，会导致持续降低）。
+    两次降低之间至少间隔一个平滑延迟，避免同一批失败请求连续降低。
+    """
+
+    # 平滑系数，以及计算基准时保留的平滑延迟个数
+    SMOOTHING = 0.1
+    BASELINE_WINDOW = 500
+    BASELINE_MIN_SAMPLES = 50
+
+    def __init__(self, initial: int = None, min_limit: int = None, max_limit: int = None):
+        self.min_limit = ADAPTIVE_MIN if min_limit is None else min_limit
+        self.max_limit = ADAPTIVE_MAX if max_limit is None else max_limit
+        initial = ADAPTIVE_INITIAL if initial is None else initial
+        self.limit = float(max(self.min_limit, min(self.max_limit, initial)))
+        self.in_flight = 0
+        self._recent = deque(maxlen=self.BASELINE_WINDOW)
+        self._smoothed = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """不等待地占用一个并发名额，已达上限时返回False"""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: float, throttled: bool = False) -> None:
+        """请求结束，反馈延迟和是否被限流/超时"""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease(0.5, '限流或超时')
+            else:
+                alpha = self.SMOOTHING
+                self._smoothed = latency if self._smoothed is None else (1 - alpha) * self._smoothed + alpha * latency
+                self._recent.append(self._smoothed)
+                baseline = sorted(self._recent)[len(self._recent) // 2]
+                if len(self._recent) >= self.BASELINE_MIN_SAMPLES and self._smoothed > baseline * ADAPTIVE_LATENCY_TOLERANCE:
+                    self._decrease(0.9, f'延迟上升 ({self._smoothed:.2f}s / 基准 {baseline:.2f}s)')
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        now = time()
+        if now - self._last_decrease < (self._smoothed or 1.0):
+            return
+        self._last_decrease = now
+        old = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        if int(self.limit) != old:
+            logger.warning(f"{reason}，并发上限 {old} -> {int(self.limit)}")
+
+
 class DigiKeyClient:
-    def __init__(self):
+    def __init__(self, hedge: Optional[bool] = None, adaptive: Optional[bool] = None,
+                 archive_path: Optional[str] = None, archive_mode: Optional[str] = None):
         self.token_cache = {
             'access_token': None,
             'expires_at': 0
@@ -41,21 +258,53 @@ class DigiKeyClient:
 
         self.client_secret = os.getenv('DIGIKEY_CLIENT_SECRET', 'your_digikey_client_secret')
 
+        self.token_file_cache = TokenFileCache(TOKEN_CACHE_FILE) if TOKEN_CACHE_FILE else None
+        self._token_lock = threading.Lock()
+
+        self.hedge = HEDGE_ENABLED if hedge is None else hedge
+        self.latency = LatencyTracker()
+        self.request_count = 0
+        self.hedge_count = 0
+        self._stats_lock = threading.Lock()
+
+        adaptive = ADAPTIVE_ENABLED if adaptive is None else adaptive
+        self.limiter = AdaptiveLimiter() if adaptive else None
+
+        archive_path = archive_path or ARCHIVE_PATH
+        self.archive_mode = (archive_mode or ARCHIVE_MODE or MODE_RECORD) if archive_path else ''
+        if self.archive_mode not in ('', MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"未知的归档模式: {self.archive_mode}")
+        self.archive = ResponseArchive(archive_path) if archive_path else None
+        if self.archive:
+            logger.info(f"响应归档: {archive_path}（{'回放' if self.archive_mode == MODE_REPLAY else '录制'}模式）")
+
 
     def get_access_token(self) -> str:
         if self.token_cache['access_token'] and time() < self.token_cache['expires_at']:
             return self.token_cache['access_token']
 
+        with self._token_lock:
+            # 等待锁期间其他线程可能已经刷新了令牌
+            if self.token_cache['access_token'] and time() < self.token_cache['expires_at']:
+                return self.token_cache['access_token']
+
+            if self.token_file_cache:
+                self.token_cache = self.token_file_cache.get_or_refresh(self.client_id, self._build_token_cache)
+            else:
+                self.token_cache = self._build_token_cache()
+            return self.token_cache['access_token']
+
+    def _build_token_cache(self) -> Dict:
+        """请求新令牌并转换为缓存格式（提前60秒过期）"""
         token_data = self._request_new_token()
-        self.token_cache = {
+        return {
             'access_token': f"Bearer {token_data['access_token']}",
             'expires_at': time() + token_data['expires_in'] - 60
         }
-        return self.token_cache['access_token']
 
     def _request_new_token(self) -> Dict:
         """请求新的访问令牌"""
-        token_url = "https://api.digikey.com/v1/oauth2/token"
+        token_url = f"{API_BASE}/v1/oauth2/token"
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {
             "client_id": self.client_id,
@@ -64,7 +313,7 @@ class DigiKeyClient:
         }
         
         try:
-            response = requests.post(token_url, headers=headers, data=data)
+            response = requests.post(token_url, headers=headers, data=data, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.HTTPError as e:
@@ -74,13 +323,135 @@ class DigiKeyClient:
             logger.error(f"请求失败: {e}")
             raise
 
+    def _timed_get(self, url: str, headers: Dict, params: Dict) -> requests.Response:
+        """发送GET请求并记录成功响应的延迟"""
+        start = time()
+        response = requests.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        self.latency.record(time() - start)
+        return response
+
+    def _reserve_hedge(self) -> bool:
+        """在对冲预算内占用一次对冲请求；启用自适应并发时还需占用一个并发名额"""
+        with self._stats_lock:
+            if self.hedge_count + 1 > self.request_count * HEDGE_BUDGET:
+                return False
+            if self.limiter is not None and not self.limiter.try_acquire():
+                # 并发已达上限（例如被限流后正在降低并发），不再增加请求
+                return False
+            self.hedge_count += 1
+            return True
+
+    def _hedge_get(self, url: str, headers: Dict, params: Dict) -> requests.Response:
+        """发送对冲请求，结束后释放占用的并发名额并反馈延迟和限流情况"""
+        if self.limiter is None:
+            return self._timed_get(url, headers, params)
+        start = time()
+        throttled = True
+        try:
+            response = self._timed_get(url, headers, params)
+            throttled = response.status_code in THROTTLE_STATUS_CODES
+            return response
+        finally:
+            self.limiter.release(time() - start, throttled)
+
+    @staticmethod
+    def _start(fn, *args) -> Future:
+        """
+        在独立线程中执行请求（不使用固定大小的线程池：调用方并发数超过线程池大小时，
+        请求在队列中的等待时间会被计入对冲阈值，导致不必要的对冲）
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='digikey-hedge', daemon=True).start()
+        return future
+
+    def _send(self, url: str, headers: Dict, params: Dict) -> requests.Response:
+        """
+        发送查询请求；启用对冲时，超过延迟阈值仍未返回则再发一个相同请求，返回先完成的响应
+        """
+        with self._stats_lock:
+            self.request_count += 1
+        threshold = self.latency.percentile(HEDGE_PERCENTILE) if self.hedge else None
+        if threshold is None:
+            return self._timed_get(url, headers, params)
+
+        primary = self._start(self._timed_get, url, headers, params)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._reserve_hedge():
+            return primary.result()
+
+        logger.info(f"请求超过 {threshold:.2f} 秒未返回，发送对冲请求: {url}")
+        hedged = self._start(self._hedge_get, url, headers, params)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 较慢的请求在后台结束，其结果被丢弃
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _limited_send(self, url: str, headers: Dict, params: Dict) -> requests.Response:
+        """在自适应并发上限内发送请求，并将延迟和限流情况反馈给控制器"""
+        if self.limiter is None:
+            response = self._send(url, headers, params)
+            response.raise_for_status()
+            return response
+
+        self.limiter.acquire()
+        start = time()
+        # 超时、连接错误等异常同样视为需要降低并发
+        throttled = True
+        try:
+            response = self._send(url, headers, params)
+            throttled = response.status_code in THROTTLE_STATUS_CODES
+            response.raise_for_status()
+            return response
+        finally:
+            self.limiter.release(time() - start, throttled)
+
+    def concurrency_limit(self) -> Optional[int]:
+        """当前的自适应并发上限，未启用时返回None"""
+        return self.limiter.current_limit if self.limiter else None
+
+    def hedge_stats(self) -> Dict:
+        """返回请求数、对冲请求数和当前对冲阈值"""
+        with self._stats_lock:
+            return {
+                'requests': self.request_count,
+                'hedges': self.hedge_count,
+                'threshold': self.latency.percentile(HEDGE_PERCENTILE)
+            }
+
     def get_product_details(self, product_number: str, manufacturer_id: Optional[str] = None) -> Optional[Dict]:
         """
-        使用ProductSearch API获取产品详细信息
+        使用ProductSearch API获取产品详细信息（回放模式下从响应归档读取）
         :param product_number: Digi-Key或制造商产品编号
         :param manufacturer_id: 可选制造商ID，用于精确匹配
         :return: 产品详细信息字典
         """
+        if self.archive_mode == MODE_REPLAY:
+            details = self.archive.get(product_number, manufacturer_id)
+            if details is MISSING:
+                logger.warning(f"响应归档中没有产品 {product_number}")
+                return None
+            return details
+
+        details = self._fetch_product_details(product_number, manufacturer_id)
+        if self.archive_mode == MODE_RECORD:
+            self.archive.put(product_number, details, manufacturer_id)
+        return details
+
+    def _fetch_product_details(self, product_number: str, manufacturer_id: Optional[str] = None) -> Optional[Dict]:
+        """调用ProductSearch API获取产品详细信息"""
         from urllib.parse import quote
         
         # 对产品编号进行URL编码，处理特殊符号
@@ -107,10 +478,9 @@ class DigiKeyClient:
         
         for attempt in range(max_retries):
             try:
-                url = f"https://api.digikey.com/products/v4/search/{encoded_product_number}/productdetails"
+                url = f"{API_BASE}/products/v4/search/{encoded_product_number}/productdetails"
                 logger.info(f"尝试API请求: {url}")
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-                response.raise_for_status()
+                response = self._limited_send(url, headers, params)
                 return response.json()
             except requests.exceptions.HTTPError as e:
                 error_msg = f"API请求失败(尝试 {attempt + 1}/{max_retries}): {e.response.status_code}"
@@ -149,16 +519,10 @@ class DigiKeyClient:
         """综合获取产品信息（支持URL或直接产品编号）"""
         result = {}
         try:
-            # 判断输入类型
-            if input_str.startswith("http"):
-                product_number = input_str.split('/')[-1].split('?')[0]
-                if not product_number:
-                    return {"success": False, "error": "无法从URL提取产品编号"}
-            else:
-                # 确保输入是字符串且去除前后空格
-                product_number = str(input_str).strip()
-                if not product_number:
-                    return {"success": False, "error": "产品编号不能为空"}
+            product_number = parse_product_input(input_str)
+            if not product_number:
+                error = "无法从URL提取产品编号" if str(input_str).strip().startswith("http") else "产品编号不能为空"
+                return {"success": False, "error": error}
 
             # 获取产品详情
             product_info = self.get_product_details(product_number)
@@ -212,9 +576,63 @@ class DigiKeyClient:
                 print(f"\n错误: {result.get('error', '未知错误')}")
 
 
+def parse_product_input(input_str: str) -> str:
+    """从产品URL或产品编号中提取产品编号，无法提取时返回空字符串"""
+    input_str = str(input_str).strip()
+    if input_str.startswith("http"):
+        return input_str.rstrip('/').split('/')[-1].split('?')[0]
+    return input_str
+
+
+def parse_product_result(details: Optional[Dict]) -> Tuple[bool, Dict]:
+    """
+    将 productdetails 响应转换为写入Excel/JSON的结果记录
+    :param details: get_product_details 的返回值
+    :return: (是否成功, 结果字典)，失败时状态以"查询失败"开头
+    """
+    if isinstance(details, dict) and details.get('Product'):
+        # 获取完整的产品信息
+        product = details.get('Product', {})
+        product_status = product.get('ProductStatus', {}).get('Status')
+        if product_status:
+            return True, {
+                'status': product_status,
+                'description': product.get('Description', {}).get('ProductDescription', ''),
+                'manufacturer': product.get('Manufacturer', {}).get('Name', ''),
+                'product_url': product.get('ProductUrl', ''),
+                'datasheet_url': product.get('DatasheetUrl', ''),
+                'quantity_available': product.get('QuantityAvailable', 0)
+            }
+        error = "查询失败: 未找到状态信息"
+    else:
+        error = f"查询失败: {details if isinstance(details, str) else '未知错误'}"
+
+    return False, {
+        'status': error,
+        'description': '',
+        'manufacturer': '',
+        'product_url': '',
+        'datasheet_url': '',
+        'quantity_available': 0
+    }
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> DigiKeyClient:
+    """返回模块级共享客户端，复用内存中的令牌缓存"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = DigiKeyClient()
+        return _default_client
+
+
 def digikey_api(product_number: str) -> Dict[str, str]:
 
-    client = DigiKeyClient()
+    client = get_default_client()
     result = client.get_product_info(product_number)
     if result.get('success'):
         return {
@@ -226,5 +644,10 @@ def digikey_api(product_number: str) -> Dict[str, str]:
 
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 or not sys.stdin.isatty():
+        # 有参数或管道输入时使用批量查询模式
+        from lookup import main
+        sys.exit(main())
     client = DigiKeyClient()
     client.get_product_info_interactive()
@@ -0,0 +1,242 @@
+import os
+import uuid
+import logging
+from time import time
+from typing import Dict, Iterable, Tuple, Optional, List
+from datetime import datetime
+from watchlist import EOL_STATUSES
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('history')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 历史结果目录（每次运行一个Parquet文件），设置为空字符串可禁用
+HISTORY_DIR = os.getenv('HISTORY_DIR', 'history')
+
+HISTORY_AVAILABLE = pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ('run_id', pa.string()),
+        ('run_at', pa.timestamp('ms')),
+        ('source', pa.string()),
+        ('product_number', pa.string()),
+        ('status', pa.string()),
+        ('manufacturer', pa.string()),
+        ('quantity_available', pa.int64()),
+    ])
+
+
+def append_run(results: Iterable[Tuple[str, Dict]], source: str, run_id: Optional[str] = None,
+               history_dir: Optional[str] = None) -> Optional[str]:
+    """
+    将一次运行的查询结果追加到历史记录（zstd压缩的Parquet文件），只记录查询成功的产品
+    :param results: (产品编号, 结果字典) 序列，例如 iter_results() 或 dict.items()
+    :param source: 结果来源（web / main / batch）
+    :return: 写入的文件路径；未安装pyarrow、历史记录被禁用、写入失败或没有成功结果时返回None
+    """
+    history_dir = HISTORY_DIR if history_dir is None else history_dir
+    if not history_dir:
+        return None
+    if not HISTORY_AVAILABLE:
+        logger.warning("未安装 pyarrow，跳过历史记录（pip install pyarrow）")
+        return None
+
+    try:
+        columns = {name: [] for name in ('product_number', 'status', 'manufacturer', 'quantity_available')}
+        for product_number, result in results:
+            status = result.get('status', '')
+            if not status or status.startswith('查询失败'):
+                continue
+            columns['product_number'].append(product_number)
+            columns['status'].append(status)
+            columns['manufacturer'].append(result.get('manufacturer', ''))
+            columns['quantity_available'].append(int(result.get('quantity_available') or 0))
+        count = len(columns['product_number'])
+        if not count:
+            return None
+
+        run_at = datetime.now()
+        run_id = run_id or uuid.uuid4().hex
+        table = pa.table({
+            'run_id': pa.array([run_id] * count, pa.string()),
+            'run_at': pa.array([run_at] * count, pa.timestamp('ms')),
+            'source': pa.array([source] * count, pa.string()),
+            **{name: values for name, values in columns.items()}
+        }, schema=_schema())
+
+        path = os.path.join(history_dir, f"run_{run_at.strftime('%Y%m%d_%H%M%S')}_{run_id}.parquet")
+        tmp_path = path + '.tmp'
+        os.makedirs(history_dir, exist_ok=True)
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+    except Exception as e:
+        # 历史记录失败不影响查询结果
+        logger.error(f"写入历史记录失败: {e}", exc_info=True)
+        return None
+    logger.info(f"历史记录已写入 {count} 条: {path}")
+    return path
+
+
+def _list_runs(history_dir: str) -> List[Tuple[datetime, str]]:
+    """按运行时间排序的 (运行时间, 文件路径)；每个文件是一次运行，运行时间取自文件的统计信息，不读取数据"""
+    runs = []
+    for name in os.listdir(history_dir):
+        if not name.endswith('.parquet'):
+            continue
+        path = os.path.join(history_dir, name)
+        metadata = pq.read_metadata(path)
+        if not metadata.num_rows:
+            continue
+        stats = metadata.row_group(0).column(metadata.schema.names.index('run_at')).statistics
+        if stats is not None and stats.has_min_max:
+            run_at = stats.min
+        else:
+            run_at = pq.read_table(path, columns=['run_at'])['run_at'][0].as_py()
+        runs.append((run_at, path))
+    return sorted(runs)
+
+
+def _latest_per_product(files: List[str]):
+    """
+    每个产品在这些运行中最后一次的状态和制造商
+    按从新到旧的顺序拼接各运行，取每个产品第一次出现的行，不需要整表排序或分组
+    """
+    table = pa.concat_tables(
+        pq.read_table(path, columns=['product_number', 'status', 'manufacturer'], read_dictionary=['status', 'manufacturer'])
+        for path in reversed(files)
+    )
+    product_numbers = table['product_number']
+    latest = table.take(pc.index_in(pc.unique(product_numbers), value_set=product_numbers))
+    return pa.table({
+        'product_number': latest['product_number'],
+        'status': latest['status'].cast(pa.string()),
+        'manufacturer': latest['manufacturer'].cast(pa.string()),
+    })
+
+
+def _latest_before(files: List[str], product_numbers):
+    """
+    指定产品在这些运行中最后一次的状态：从最新的运行向前读取，所有产品都找到后停止
+    （定期检查同一批零件时通常只需读取一个文件）
+    """
+    remaining = product_numbers
+    found = []
+    for path in reversed(files):
+        if not len(remaining):
+            break
+        table = pq.read_table(path, columns=['product_number', 'status'])
+        table = table.filter(pc.is_in(table['product_number'], value_set=remaining))
+        if table.num_rows:
+            found.append(table)
+            remaining = remaining.filter(pc.invert(pc.is_in(remaining, value_set=table['product_number'])))
+    before = pa.concat_tables(found) if found else pa.table(
+        {'product_number': pa.array([], pa.string()), 'status': pa.array([], pa.string())}
+    )
+    # 同一次运行中重复的产品只保留一条
+    before = before.take(pc.index_in(pc.unique(before['product_number']), value_set=before['product_number']))
+    return before.rename_columns(['product_number', 'previous_status'])
+
+
+def _naive_local(value: Optional[datetime]) -> Optional[datetime]:
+    """运行时间以本地时间（不带时区）保存，带时区的参数转换为本地时间后比较"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def lifecycle_report(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     statuses: Optional[List[str]] = None, limit: int = 100,
+                     history_dir: Optional[str] = None) -> Dict:
+    """
+    生命周期分析：对比 since 之前和 [since, until] 期间各产品最后一次的状态
+    :param statuses: 关注的目标状态（默认为接近停产的状态）
+    :param limit: 返回的变化明细条数上限
+    :return: 期间各状态/制造商的产品数，以及状态变为目标状态的产品（按制造商汇总和明细）
+    """
+    if not HISTORY_AVAILABLE:
+        return {'status': 'error', 'message': '未安装 pyarrow，无法进行历史分析'}
+    history_dir = HISTORY_DIR if history_dir is None else history_dir
+    start = time()
+    runs = _list_runs(history_dir) if history_dir and os.path.isdir(history_dir) else []
+    if not runs:
+        return {'status': 'error', 'message': '没有历史记录'}
+
+    statuses = list(statuses or EOL_STATUSES)
+    since, until = _naive_local(since), _naive_local(until)
+    # 只读取需要的运行：期间内的运行全部读取，期间前的运行只读取到找到期间内各产品的上一次状态为止
+    period_files = [path for run_at, path in runs if (not since or run_at >= since) and (not until or run_at <= until)]
+    before_files = [path for run_at, path in runs if since and run_at < since]
+    if period_files:
+        after = _latest_per_product(period_files)
+    else:
+        after = _schema().empty_table().select(['product_number', 'status', 'manufacturer'])
+    before = _latest_before(before_files, after['product_number'].combine_chunks())
+
+    # 期间内最后状态的分布（状态 x 制造商）
+    in_target = pc.is_in(after['status'], value_set=pa.array(statuses, pa.string()))
+    by_status = after.group_by('status').aggregate([('product_number', 'count')])
+    target_by_manufacturer = after.filter(in_target).group_by(['manufacturer', 'status']).aggregate(
+        [('product_number', 'count')]
+    ).sort_by([('product_number_count', 'descending')])
+
+    # 状态变化：期间前已有记录、期间内变为目标状态
+    joined = after.join(before, 'product_number', join_type='inner')
+    changed = joined.filter(pc.and_(
+        pc.is_in(joined['status'], value_set=pa.array(statuses, pa.string())),
+        pc.not_equal(joined['status'], joined['previous_status'])
+    ))
+    changes_by_manufacturer = changed.group_by(['manufacturer', 'previous_status', 'status']).aggregate(
+        [('product_number', 'count')]
+    ).sort_by([('product_number_count', 'descending')])
+
+    def rows(table, count_name='count'):
+        return [
+            {(count_name if key == 'product_number_count' else key): value for key, value in row.items()}
+            for row in table.to_pylist()
+        ]
+
+    changes = changed.sort_by([('manufacturer', 'ascending'), ('product_number', 'ascending')]).slice(0, limit)
+    report = {
+        'status': 'success',
+        'runs': len(period_files),
+        'statuses': statuses,
+        'products': after.num_rows,
+        'by_status': rows(by_status.sort_by([('product_number_count', 'descending')])),
+        'target_by_manufacturer': rows(target_by_manufacturer),
+        'changed_count': changed.num_rows,
+        'changes_by_manufacturer': rows(changes_by_manufacturer),
+        'changes': changes.select(['product_number', 'manufacturer', 'previous_status', 'status']).to_pylist(),
+    }
+    report['elapsed_ms'] = round((time() - start) * 1000, 1)
+    return report
@@ -0,0 +1,251 @@
+import os
+import json
+import uuid
+import sqlite3
+import logging
+from time import time
+from typing import Optional, Dict
+from datetime import datetime
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('job_queue')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 默认数据库路径，可通过环境变量指向多台机器共享的目录
+DEFAULT_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join('data', 'jobs.db'))
+DEFAULT_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化本地任务队列
+
+    任务状态: pending -> leased -> done / failed，排队中的任务可被取消（cancelled）
+    优先级高的任务先被领取，同优先级按提交顺序
+    工作进程通过 lease() 领取任务，处理完成后 ack()，失败时 nack()。
+    租约超时（工作进程崩溃）后任务会重新对其他工作进程可见。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, visibility_timeout: Optional[int] = None,
+                 max_attempts: Optional[int] = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self.visibility_timeout = visibility_timeout or DEFAULT_VISIBILITY_TIMEOUT
+        self.max_attempts = max_attempts or DEFAULT_MAX_ATTEMPTS
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 不启用WAL：WAL依赖共享内存，无法用于多台机器共享的网络目录
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, priority, created_at)")
+        finally:
+            conn.close()
+
+    def enqueue(self, payload: Dict, job_id: Optional[str] = None, priority: int = 0) -> str:
+        """添加任务到队列，返回任务ID"""
+        job_id = job_id or uuid.uuid4().hex
+        now = time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (job_id, payload, state, max_attempts, priority, created_at, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), self.max_attempts, priority, now, now)
+            )
+        finally:
+            conn.close()
+        logger.info(f"任务已加入队列: {job_id}")
+        return job_id
+
+    def lease(self, worker_id: str, visibility_timeout: Optional[int] = None) -> Optional[Dict]:
+        """
+        领取一个待处理任务
+        :param worker_id: 工作进程标识
+        :param visibility_timeout: 租约时长（秒），超时未确认的任务会重新可见
+        :return: 任务字典（job_id, payload, attempts, priority），没有任务时返回None
+        """
+        timeout = visibility_timeout or self.visibility_timeout
+        now = time()
+        conn = self._connect()
+        try:
+            # IMMEDIATE事务获取写锁，保证同一任务只被一个工作进程领取
+            conn.execute("BEGIN IMMEDIATE")
+            while True:
+                row = conn.execute(
+                    "SELECT job_id, payload, attempts, max_attempts, priority FROM jobs "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None or row['attempts'] < row['max_attempts']:
+                    break
+                # 租约多次超时（工作进程反复崩溃），不再重试
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', lease_owner = NULL, last_error = ?, updated_at = ? "
+                    "WHERE job_id = ?",
+                    ('超过最大尝试次数', now, row['job_id'])
+                )
+                logger.error(f"任务 {row['job_id']} 超过最大尝试次数，标记为失败")
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                (worker_id, now + timeout, now, row['job_id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"工作进程 {worker_id} 领取任务: {row['job_id']} (第 {row['attempts'] + 1} 次尝试)")
+        return {
+            'job_id': row['job_id'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1,
+            'priority': row['priority']
+        }
+
+    def heartbeat(self, job_id: str, worker_id: str, visibility_timeout: Optional[int] = None) -> bool:
+        """延长租约，返回False表示租约已丢失（已被其他工作进程接管）"""
+        timeout = visibility_timeout or self.visibility_timeout
+        now = time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE job_id = ? AND state = 'leased' AND lease_owner = ?",
+                (now + timeout, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def ack(self, job_id: str, worker_id: str) -> bool:
+        """确认任务完成"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ?",
+                (time(), job_id, worker_id)
+            )
+        finally:
+            conn.close()
+        if cursor.rowcount != 1:
+            logger.warning(f"确认任务失败，租约已丢失: {job_id}")
+            return False
+        logger.info(f"任务已完成: {job_id}")
+        return True
+
+    def nack(self, job_id: str, worker_id: str, error: str = '', retry: bool = True) -> bool:
+        """任务处理失败；retry为True且未超过最大尝试次数时重新排队"""
+        now = time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN ? AND attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+                "lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ?",
+                (1 if retry else 0, error, now, job_id, worker_id)
+            )
+        finally:
+            conn.close()
+        if cursor.rowcount != 1:
+            logger.warning(f"任务失败回退时租约已丢失: {job_id}")
+            return False
+        logger.warning(f"任务处理失败: {job_id} - {error}")
+        return True
+
+    def cancel(self, job_id: str) -> bool:
+        """取消尚未被领取的任务，返回False表示任务已在处理或已结束"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'cancelled', updated_at = ? WHERE job_id = ? AND state = 'pending'",
+                (time(), job_id)
+            )
+        finally:
+            conn.close()
+        if cursor.rowcount == 1:
+            logger.info(f"排队中的任务已取消: {job_id}")
+            return True
+        return False
+
+    def purge(self, before: float) -> int:
+        """删除在指定时间之前结束（done / failed / cancelled）的任务，返回删除数量"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'failed', 'cancelled') AND updated_at < ?", (before,)
+            )
+        finally:
+            conn.close()
+        if cursor.rowcount:
+            logger.info(f"已清理 {cursor.rowcount} 个过期任务")
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查询任务的队列状态"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT job_id, state, priority, attempts, lease_owner, last_error, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import logging
+from time import time
+from typing import Optional, Dict, List
+from datetime import datetime
+from job_queue import DEFAULT_DB_PATH
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('job_store')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 任务状态: queued -> processing (<-> paused) -> done / failed / cancelled
+ACTIVE_STATES = ('queued', 'processing', 'paused')
+
+# 任务控制指令，由处理中的任务定期检查
+CONTROL_PAUSE = 'pause'
+CONTROL_CANCEL = 'cancel'
+
+# 允许通过 update() 修改的字段
+_UPDATABLE_FIELDS = {'state', 'progress', 'current_product', 'total_products', 'message', 'result_path', 'partial_path', 'filename', 'control', 'concurrency_limit'}
+
+
+class JobStore:
+    """
+    多进程共享的任务状态存储（与任务队列共用同一个SQLite文件）
+
+    Web 服务的多个工作进程和独立的 worker.py 进程都通过它读写任务进度，
+    查询结果以NDJSON文件保存在磁盘上，这里只记录文件路径（result_path）。
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_status (
+                    job_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    filename TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    current_product TEXT NOT NULL DEFAULT '',
+                    total_products INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    result_path TEXT,
+                    partial_path TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    control TEXT,
+                    concurrency_limit INTEGER,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_status_created ON job_status (created_at)")
+        finally:
+            conn.close()
+
+    def create(self, job_id: str, filename: Optional[str] = None, message: str = '', priority: int = 0) -> None:
+        """登记新任务（排队中）"""
+        now = time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO job_status (job_id, state, filename, message, priority, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, message, priority, now, now)
+            )
+        finally:
+            conn.close()
+
+    def update(self, job_id: str, **fields) -> None:
+        """
+        更新任务状态字段
+        :param fields: state, progress, current_product, total_products, message, result_path, partial_path, filename, control,
+                       concurrency_limit
+        """
+        unknown = set(fields) - _UPDATABLE_FIELDS
+        if unknown:
+            raise ValueError(f"未知的任务状态字段: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        values = list(fields.values()) + [time(), job_id]
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE job_status SET {columns}, updated_at = ? WHERE job_id = ?", values)
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取任务状态，任务不存在时返回None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM job_status WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_dict(row)
+
+    def get_control(self, job_id: str) -> Optional[str]:
+        """读取任务控制指令（pause / cancel / None）"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT control FROM job_status WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return row['control'] if row else None
+
+    def latest(self) -> Optional[Dict]:
+        """获取最近提交的任务状态"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM job_status ORDER BY created_at DESC LIMIT 1").fetchone()
+        finally:
+            conn.close()
+        return self._to_dict(row)
+
+    def latest_finished(self) -> Optional[Dict]:
+        """获取最近完成的任务状态"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT * FROM job_status WHERE state = 'done' ORDER BY updated_at DESC LIMIT 1"
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._to_dict(row)
+
+    def finished_before(self, before: float, limit: int = 100) -> List[Dict]:
+        """列出在指定时间之前结束的任务（用于结果转存和过期清理）"""
+        placeholders = ', '.join('?' for _ in ACTIVE_STATES)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM job_status WHERE state NOT IN ({placeholders}) AND updated_at < ? "
+                f"ORDER BY updated_at LIMIT ?",
+                (*ACTIVE_STATES, before, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._to_dict(row) for row in rows]
+
+    def active_filenames(self) -> List[str]:
+        """正在排队或处理中的任务所使用的上传文件名"""
+        placeholders = ', '.join('?' for _ in ACTIVE_STATES)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT DISTINCT filename FROM job_status WHERE state IN ({placeholders}) AND filename IS NOT NULL",
+                ACTIVE_STATES
+            ).fetchall()
+        finally:
+            conn.close()
+        return [row['filename'] for row in rows]
+
+    def delete(self, job_ids: List[str]) -> int:
+        """删除任务状态记录，返回删除数量"""
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            conn.executemany("DELETE FROM job_status WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+            return conn.total_changes - before
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        status = dict(row)
+        status['is_processing'] = status['state'] in ACTIVE_STATES
+        return status
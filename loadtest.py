@@ -0,0 +1,410 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import logging
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+import requests
+import openpyxl
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'main_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('loadtest')
+logger.setLevel(logging.DEBUG)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.DEBUG)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+STUB_STATUSES = ['Active'] * 8 + ['Obsolete', 'Not For New Designs']
+
+
+class StubDigiKeyHandler(BaseHTTPRequestHandler):
+    """模拟 DigiKey OAuth 和 productdetails 接口，延迟和限流比例由服务器属性控制"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.startswith('/v1/oauth2/token'):
+            self._send_json(200, {'access_token': 'stub-token', 'expires_in': 3600})
+        else:
+            self._send_json(404, {'detail': 'Not Found'})
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].split('/')
+        if len(parts) != 6 or parts[-1] != 'productdetails':
+            self._send_json(404, {'detail': 'Not Found'})
+            return
+        server = self.server
+        # 指数分布的延迟，模拟少量慢请求
+        time.sleep(random.expovariate(1 / server.latency) if server.latency > 0 else 0)
+        if random.random() < server.throttle_rate:
+            self._send_json(429, {'detail': 'Too Many Requests'})
+            return
+        product_number = unquote(parts[4])
+        self._send_json(200, {'Product': {
+            'ProductStatus': {'Status': random.choice(STUB_STATUSES)},
+            'Description': {'ProductDescription': f'Stub part {product_number}'},
+            'Manufacturer': {'Name': random.choice(['TI', 'ADI', 'ST', 'NXP'])},
+            'ProductUrl': f'https://www.digikey.com/en/products/detail/{product_number}',
+            'DatasheetUrl': '',
+            'QuantityAvailable': random.randint(0, 10000)
+        }})
+
+
+def start_stub_server(latency: float, throttle_rate: float) -> ThreadingHTTPServer:
+    """在随机端口启动模拟DigiKey服务"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubDigiKeyHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.throttle_rate = throttle_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_web_server(stub_url: str, workdir: str, extra_env: dict = None):
+    """以子进程启动 web.py，所有数据目录放在 workdir 中，返回 (进程, 地址)"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'DIGIKEY_API_BASE': stub_url,
+        'DIGIKEY_TOKEN_CACHE': '',
+        'DIGIKEY_ARCHIVE': '',
+        'JOB_DB_PATH': os.path.join(workdir, 'data', 'jobs.db'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'RESULTS_DIR': os.path.join(workdir, 'results'),
+        'HISTORY_DIR': '',
+        'WATCH_REFRESH_ENABLED': '0',
+        'JANITOR_ENABLED': '0',
+        'PARTIAL_SAVE_SECONDS': '5',
+    })
+    env.update(extra_env or {})
+    web_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web.py')
+    process = subprocess.Popen([sys.executable, web_py], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError('Web服务启动失败')
+        try:
+            requests.get(base_url + '/processing_status', timeout=1)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Web服务启动超时')
+
+
+class ProcessSampler:
+    """定期采样进程的CPU使用率和常驻内存（读取 /proc，仅限Linux；其他平台需要安装psutil）"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+
+    def _read(self):
+        """返回 (累计CPU秒数, RSS字节)，无法读取时返回None"""
+        if self._process is not None:
+            cpu = self._process.cpu_times()
+            return cpu.user + cpu.system, self._process.memory_info().rss
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{self.pid}/status') as f:
+                rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            return None
+        return (int(fields[11]) + int(fields[12])) / self._clock_ticks, rss_kb * 1024
+
+    def _run(self):
+        last = self._read()
+        last_time = time.time()
+        while last and not self._stop_event.wait(self.interval):
+            current = self._read()
+            if current is None:
+                break
+            now = time.time()
+            self.samples.append(((current[0] - last[0]) / (now - last_time) * 100, current[1]))
+            last, last_time = current, now
+
+    def start(self):
+        self.samples = []
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        if not self.samples:
+            return {'cpu_avg': None, 'cpu_max': None, 'rss_max_mb': None}
+        return {
+            'cpu_avg': round(sum(s[0] for s in self.samples) / len(self.samples), 1),
+            'cpu_max': round(max(s[0] for s in self.samples), 1),
+            'rss_max_mb': round(max(s[1] for s in self.samples) / 1024 / 1024, 1)
+        }
+
+
+def make_workbook(rows: int, distinct: int) -> bytes:
+    """生成测试用的Excel文件内容"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet1'
+    sheet.append(['产品编号'])
+    for i in range(rows):
+        sheet.append([f'LT-{i % distinct:06d}'])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class Stats:
+    """线程安全地收集各接口的延迟、错误数和任务完成时间"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.job_times = []
+        self.failed_jobs = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, latency: float, ok: bool):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def record_job(self, elapsed: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.job_times.append(elapsed)
+            else:
+                self.failed_jobs += 1
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_client(base_url: str, client_id: int, workbook: bytes, stats: Stats, stop_at: float,
+               poll_interval: float, job_timeout: float):
+    """单个模拟用户：循环执行 上传 -> 开始处理 -> 轮询状态 -> 下载结果"""
+    session = requests.Session()
+
+    def call(endpoint, method, path, **kwargs):
+        start = time.time()
+        try:
+            response = session.request(method, base_url + path, timeout=60, **kwargs)
+            ok = response.status_code == 200
+            body = response.json() if ok and response.headers.get('Content-Type', '').startswith('application/json') else None
+            if body is not None and body.get('status') == 'error':
+                ok = False
+        except requests.exceptions.RequestException:
+            ok, body = False, None
+        stats.record(endpoint, time.time() - start, ok)
+        return ok, body
+
+    n = 0
+    while time.time() < stop_at:
+        n += 1
+        job_start = time.time()
+        filename = f'lt_{client_id}_{n}.xlsx'
+        ok, body = call('upload', 'POST', '/upload', files={'file': (filename, workbook)})
+        if not ok:
+            stats.record_job(0, False)
+            continue
+        ok, body = call('start_processing', 'POST', '/start_processing', json={
+            'filename': body['filename'], 'sheet_name': 'Sheet1', 'column_name': '产品编号',
+            'selected_fields': ['status', 'manufacturer']
+        })
+        if not ok:
+            stats.record_job(0, False)
+            continue
+        job_id = body['job_id']
+
+        state = None
+        while time.time() - job_start < job_timeout:
+            time.sleep(poll_interval)
+            ok, body = call('processing_status', 'GET', f'/processing_status?job_id={job_id}')
+            if ok and not body.get('is_processing'):
+                state = body.get('state')
+                break
+        if state != 'done':
+            stats.record_job(time.time() - job_start, False)
+            continue
+
+        ok, _ = call('download_result', 'GET', f'/download_result?job_id={job_id}')
+        stats.record_job(time.time() - job_start, ok)
+
+
+def run_step(base_url: str, clients: int, duration: float, workbook: bytes, sampler: ProcessSampler,
+             poll_interval: float, job_timeout: float) -> dict:
+    """以指定并发用户数运行一轮测试，返回汇总结果"""
+    stats = Stats()
+    if sampler:
+        sampler.start()
+    stop_at = time.time() + duration
+    threads = [
+        threading.Thread(target=run_client, args=(base_url, i, workbook, stats, stop_at, poll_interval, job_timeout),
+                         daemon=True)
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    resources = sampler.stop() if sampler else {}
+
+    endpoints = {}
+    for endpoint, values in stats.latencies.items():
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'errors': stats.errors.get(endpoint, 0),
+            'p50_ms': round(percentile(values, 50) * 1000, 1),
+            'p95_ms': round(percentile(values, 95) * 1000, 1),
+            'p99_ms': round(percentile(values, 99) * 1000, 1),
+        }
+    total_requests = sum(len(v) for v in stats.latencies.values())
+    total_errors = sum(stats.errors.values())
+    return {
+        'clients': clients,
+        'requests': total_requests,
+        'error_rate': round(total_errors / total_requests * 100, 2) if total_requests else 0,
+        'jobs_done': len(stats.job_times),
+        'jobs_failed': stats.failed_jobs,
+        'job_p50_s': round(percentile(stats.job_times, 50), 2) if stats.job_times else None,
+        'job_p95_s': round(percentile(stats.job_times, 95), 2) if stats.job_times else None,
+        'endpoints': endpoints,
+        **resources
+    }
+
+
+def print_report(results):
+    print()
+    print(f"{'用户数':>6} {'请求数':>8} {'错误率%':>8} {'完成任务':>8} {'失败任务':>8} {'任务P50(s)':>10} {'任务P95(s)':>10} "
+          f"{'CPU均值%':>9} {'RSS峰值MB':>10}")
+    for r in results:
+        print(f"{r['clients']:>6} {r['requests']:>8} {r['error_rate']:>8} {r['jobs_done']:>8} {r['jobs_failed']:>8} "
+              f"{str(r['job_p50_s']):>10} {str(r['job_p95_s']):>10} {str(r.get('cpu_avg')):>9} {str(r.get('rss_max_mb')):>10}")
+    print()
+    for r in results:
+        print(f"用户数 {r['clients']}:")
+        for endpoint, e in sorted(r['endpoints'].items()):
+            print(f"  {endpoint:<18} 请求 {e['requests']:>6}  错误 {e['errors']:>4}  "
+                  f"P50 {e['p50_ms']:>8} ms  P95 {e['p95_ms']:>8} ms  P99 {e['p99_ms']:>8} ms")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Web服务压力测试（使用本地模拟的DigiKey接口）')
+    parser.add_argument('--clients', default='1,5,10,20', help='逐步增加的并发用户数，逗号分隔（默认 1,5,10,20）')
+    parser.add_argument('--duration', type=float, default=30, help='每一轮的持续时间（秒，默认30）')
+    parser.add_argument('--rows', type=int, default=50, help='每个上传文件的行数（默认50）')
+    parser.add_argument('--distinct', type=int, default=10000, help='产品编号的不同取值数量（默认10000）')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='状态轮询间隔（秒，默认1）')
+    parser.add_argument('--job-timeout', type=float, default=300, help='单个任务的最长等待时间（秒，默认300）')
+    parser.add_argument('--stub-latency', type=float, default=0.2, help='模拟接口的平均延迟（秒，默认0.2）')
+    parser.add_argument('--stub-throttle', type=float, default=0.0, help='模拟接口返回429的比例（默认0）')
+    parser.add_argument('--url', help='测试已运行的Web服务（不启动模拟接口和Web服务）')
+    parser.add_argument('--server-pid', type=int, help='配合 --url 使用，采样该进程的CPU和内存')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='启动Web服务时额外设置的环境变量（可重复），例如 EMBEDDED_WORKERS=8')
+    parser.add_argument('--json-output', help='将结果保存为JSON文件')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    steps = [int(c) for c in args.clients.split(',') if c.strip()]
+    workbook = make_workbook(args.rows, args.distinct)
+
+    process = None
+    workdir = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            sampler = ProcessSampler(args.server_pid) if args.server_pid else None
+        else:
+            stub = start_stub_server(args.stub_latency, args.stub_throttle)
+            stub_url = f'http://127.0.0.1:{stub.server_address[1]}'
+            workdir = tempfile.mkdtemp(prefix='digikey_loadtest_')
+            extra_env = dict(item.split('=', 1) for item in args.server_env)
+            process, base_url = start_web_server(stub_url, workdir, extra_env)
+            sampler = ProcessSampler(process.pid)
+            logger.info(f"模拟接口: {stub_url}, Web服务: {base_url}, 工作目录: {workdir}")
+
+        results = []
+        for clients in steps:
+            logger.info(f"开始测试: {clients} 个并发用户, {args.duration} 秒")
+            result = run_step(base_url, clients, args.duration, workbook, sampler, args.poll_interval, args.job_timeout)
+            logger.info(f"完成: {result['requests']} 个请求, 错误率 {result['error_rate']}%, 完成任务 {result['jobs_done']}")
+            results.append(result)
+
+        print_report(results)
+        if args.json_output:
+            with open(args.json_output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            logger.info(f"结果已保存到 {args.json_output}")
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,145 @@
+"""
+快速批量查询 DigiKey 产品状态（适合在 shell 管道中使用）
+
+    python lookup.py LM358DR NE555P
+    cat parts.txt | python lookup.py -f jsonl > status.jsonl
+
+输入为产品编号或产品URL（命令行参数，或从标准输入每行一个，# 开头的行忽略），
+并发查询，每完成一个即输出一行 TSV 或 JSON。
+requests 等依赖在读到第一个输入时才加载，--help 和空输入立即返回。
+"""
+import sys
+import argparse
+
+# 本模块只导入标准库中的轻量模块，不在导入时配置日志文件；
+# digikey（requests、日志处理器等）在读到第一个输入后才导入
+
+TSV_FIELDS = ('status', 'manufacturer', 'quantity_available', 'description', 'product_url', 'datasheet_url')
+
+
+def iter_inputs(args_inputs):
+    """依次返回命令行参数或标准输入中的产品编号/URL（标准输入边读边返回）"""
+    lines = args_inputs if args_inputs and args_inputs != ['-'] else sys.stdin
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def format_record(input_str, product_number, result, output_format):
+    if output_format == 'jsonl':
+        import json
+        record = {'input': input_str, 'product_number': product_number}
+        record.update(result)
+        return json.dumps(record, ensure_ascii=False)
+    values = [input_str, product_number] + [str(result.get(field, '')) for field in TSV_FIELDS]
+    return '\t'.join(v.replace('\t', ' ').replace('\n', ' ') for v in values)
+
+
+def _quiet_console_logging(verbose):
+    """库模块导入时会添加控制台日志，批量模式下只保留警告以上，避免干扰输出"""
+    import logging
+    level = logging.INFO if verbose else logging.WARNING
+    for name in list(logging.root.manager.loggerDict):
+        for handler in logging.getLogger(name).handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(level)
+
+
+def run(inputs, workers=8, output_format='tsv', keep_order=False, header=False, verbose=False, out=None):
+    """
+    并发查询并逐行输出结果
+    :return: 查询失败的数量
+    """
+    out = out or sys.stdout
+    if header and output_format == 'tsv':
+        out.write('\t'.join(('input', 'product_number') + TSV_FIELDS) + '\n')
+        out.flush()
+
+    inputs = iter(inputs)
+    first = next(inputs, None)
+    if first is None:
+        return 0
+
+    # 有输入时才加载查询相关的模块
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from collections import deque
+    from itertools import chain
+    from digikey import DigiKeyClient, parse_product_input, parse_product_result
+    _quiet_console_logging(verbose)
+    client = DigiKeyClient()
+
+    failures = 0
+    seen = set()
+    pending = deque()
+
+    def emit(input_str, product_number, future):
+        nonlocal failures
+        try:
+            details = future.result()
+        except Exception as e:
+            details = str(e)
+        success, result = parse_product_result(details)
+        failures += not success
+        out.write(format_record(input_str, product_number, result, output_format) + '\n')
+        out.flush()
+
+    def drain(block=False, final=False):
+        # 按输入顺序输出时只输出队首已完成的结果；否则输出所有已完成的结果。
+        # block 时只等到有一个结果可以输出（滑动窗口），final 时输出全部剩余结果
+        while pending:
+            if keep_order:
+                if not (block or final) and not pending[0][2].done():
+                    break
+                emit(*pending.popleft())
+                block = False
+            else:
+                if block or final:
+                    wait([item[2] for item in pending], return_when=FIRST_COMPLETED)
+                    block = False
+                done = [item for item in pending if item[2].done()]
+                if not done:
+                    break
+                for item in done:
+                    pending.remove(item)
+                    emit(*item)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for input_str in chain([first], inputs):
+            product_number = parse_product_input(input_str)
+            if not product_number or product_number in seen:
+                continue
+            seen.add(product_number)
+            pending.append((input_str, product_number, executor.submit(client.get_product_details, product_number)))
+            # 控制未完成请求的数量，边读边输出
+            drain(block=len(pending) >= workers * 4)
+        drain(final=True)
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='批量查询 DigiKey 产品状态，输出 TSV 或 JSON 行')
+    parser.add_argument('inputs', nargs='*', help='产品编号或产品URL；省略或为 - 时从标准输入读取（每行一个）')
+    parser.add_argument('-f', '--format', choices=('tsv', 'jsonl'), default='tsv', help='输出格式（默认 tsv）')
+    parser.add_argument('-j', '--workers', type=int, default=8, help='并发查询数（默认8）')
+    parser.add_argument('--keep-order', action='store_true', help='按输入顺序输出（默认按完成顺序）')
+    parser.add_argument('--header', action='store_true', help='TSV 输出表头行')
+    parser.add_argument('-v', '--verbose', action='store_true', help='在标准错误输出详细日志')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        failures = run(iter_inputs(args.inputs), args.workers, args.format, args.keep_order, args.header, args.verbose)
+    except BrokenPipeError:
+        # 下游提前关闭（例如 | head）
+        sys.stderr.close()
+        return 0
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
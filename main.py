@@ -1,6 +1,9 @@
-from digikey import DigiKeyClient
-from write_excel import read_excel_data, write_multiple_columns
-import json
+from digikey import DigiKeyClient, parse_product_result
+import openpyxl
+from write_excel import read_excel_data, IncrementalExcelWriter
+from result_stream import ResultStreamWriter, result_path
+from response_archive import MODE_REPLAY
+from history import append_run
 import os
 import sys
 import logging
@@ -34,6 +37,29 @@ console_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
+# 输出列名后缀与结果字段的对应关系
+COLUMN_FIELDS = [
+    ('', 'status'),
+    ('_描述', 'description'),
+    ('_制造商', 'manufacturer'),
+    ('_产品链接', 'product_url'),
+    ('_数据手册', 'datasheet_url'),
+    ('_可用数量', 'quantity_available')
+]
+
+def build_column_headers(output_column):
+    """生成输出列名列表"""
+    return [f"{output_column}{suffix}" for suffix, _ in COLUMN_FIELDS]
+
+def build_row_values(result):
+    """生成单行的输出列值（与 build_column_headers 顺序一致）"""
+    return [result.get(field, 0 if field == 'quantity_available' else '') for _, field in COLUMN_FIELDS]
+
+def build_columns_data(results, data, output_column):
+    """按Excel行顺序生成多列写入数据"""
+    rows = [build_row_values(results.get(p, {})) for p in data]
+    return {header: [row[i] for row in rows] for i, header in enumerate(build_column_headers(output_column))}
+
 def process_products(excel_path, sheet_name, product_number_column, output_column):
     logger.info(f"开始处理产品数据: 文件={excel_path}, 工作表={sheet_name}, 产品编号列={product_number_column}, 输出列={output_column}")
     
@@ -42,7 +68,10 @@ def process_products(excel_path, sheet_name, product_number_column, output_colum
         logger.info("成功创建DigiKey客户端")
         
         # 读取数据并获取表头行号
-        data, header_row, header_column = read_excel_data(excel_path, sheet_name, product_number_column, return_header_info=True)
+        # 工作簿只加载一次，读取产品编号和写入结果共用
+        workbook = openpyxl.load_workbook(excel_path)
+        data, header_row, header_column = read_excel_data(excel_path, sheet_name, product_number_column,
+                                                          return_header_info=True, workbook=workbook)
         if not data:
             error_msg = '未获取到有效的产品数据'
             logger.error(error_msg)
@@ -57,6 +86,15 @@ def process_products(excel_path, sheet_name, product_number_column, output_colum
         success_count = 0
         failure_count = 0
         
+        # 结果逐条写入本次运行的NDJSON文件
+        data_file = result_path(f"main_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        stream = ResultStreamWriter(data_file)
+        
+        # 查询结果逐行交给写入线程，定期保存部分结果文件
+        stem, ext = os.path.splitext(excel_path)
+        writer = IncrementalExcelWriter(excel_path, sheet_name, build_column_headers(output_column), header_row,
+                                        partial_path=f"{stem}.partial{ext}", workbook=workbook)
+        
         for i, product_number in enumerate(data, 1):
             progress = i / total * 100
             sys.stdout.write(f"\r处理进度: {i}/{total} ({progress:.1f}%) - 当前产品: {product_number}")
@@ -65,71 +103,28 @@ def process_products(excel_path, sheet_name, product_number_column, output_colum
             logger.debug(f"正在处理产品 {i}/{total}: {product_number}")
             
             details = client.get_product_details(product_number)
-            if isinstance(details, dict) and details.get('Product'):
-                # 获取完整的产品信息
-                product = details.get('Product', {})
-                product_status = product.get('ProductStatus', {}).get('Status')
-                product_description = product.get('Description', {}).get('ProductDescription', '')
-                manufacturer = product.get('Manufacturer', {}).get('Name', '')
-                product_url = product.get('ProductUrl', '')
-                datasheet_url = product.get('DatasheetUrl', '')
-                quantity_available = product.get('QuantityAvailable', 0)
-                
-                if product_status:
-                    results[product_number] = {
-                        'status': product_status,
-                        'description': product_description,
-                        'manufacturer': manufacturer,
-                        'product_url': product_url,
-                        'datasheet_url': datasheet_url,
-                        'quantity_available': quantity_available
-                    }
-                    success_count += 1
-                    logger.debug(f"成功获取产品状态: {product_number} -> {product_status}")
-                else:
-                    results[product_number] = {
-                        'status': "查询失败: 未找到状态信息",
-                        'description': '',
-                        'manufacturer': '',
-                        'product_url': '',
-                        'datasheet_url': '',
-                        'quantity_available': 0
-                    }
-                    failure_count += 1
-                    logger.warning(f"产品 {product_number} 未找到状态信息")
+            success, result = parse_product_result(details)
+            if product_number not in results:
+                stream.write(product_number, result)
+            results[product_number] = result
+            writer.put(i - 1, build_row_values(result))
+            if success:
+                success_count += 1
+                logger.debug(f"成功获取产品状态: {product_number} -> {result['status']}")
             else:
-                results[product_number] = {
-                    'status': f"查询失败: {details if isinstance(details, str) else '未知错误'}",
-                    'description': '',
-                    'manufacturer': '',
-                    'product_url': '',
-                    'datasheet_url': '',
-                    'quantity_available': 0
-                }
                 failure_count += 1
-                logger.warning(f"产品 {product_number} 查询失败: {details if isinstance(details, str) else '未知错误'}")
+                logger.warning(f"产品 {product_number} {result['status']}")
                 
+        stream.close()
         print("\n产品处理完成！")
         logger.info(f"产品处理完成！成功: {success_count}, 失败: {failure_count}")
-        
-        # 保存结果到JSON文件
-        data_file = os.path.join(os.path.dirname(__file__), 'product_details.json')
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
         logger.info(f"结果已保存到 {data_file}")
+        # 回放归档的结果不是新的查询数据，不计入历史记录
+        if client.archive_mode != MODE_REPLAY:
+            append_run(results.items(), 'main')
         
-        # 准备多列数据
-        columns_data = {
-            output_column: [results.get(p, {}).get('status', '') for p in data],
-            f"{output_column}_描述": [results.get(p, {}).get('description', '') for p in data],
-            f"{output_column}_制造商": [results.get(p, {}).get('manufacturer', '') for p in data],
-            f"{output_column}_产品链接": [results.get(p, {}).get('product_url', '') for p in data],
-            f"{output_column}_数据手册": [results.get(p, {}).get('datasheet_url', '') for p in data],
-            f"{output_column}_可用数量": [results.get(p, {}).get('quantity_available', 0) for p in data]
-        }
-        
-        # 写入Excel（多列数据）
-        write_result = write_multiple_columns(excel_path, sheet_name, columns_data, max_search_rows=10, reference_header=product_number_column, reference_header_row=header_row)
+        # 等待写入线程完成并保存Excel
+        write_result = writer.close()
         if isinstance(write_result, dict) and write_result.get('status') == 'error':
             logger.error(f"写入Excel失败: {write_result.get('message')}")
             return write_result
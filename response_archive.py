@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import zlib
+import sqlite3
+import threading
+import logging
+from time import time
+from typing import Optional, Dict, Iterator, Tuple
+from datetime import datetime
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('response_archive')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 录制/回放模式
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+# 区分"未录制"和"录制的是失败结果(None)"
+MISSING = object()
+
+
+class ResponseArchive:
+    """
+    productdetails 原始响应的本地归档（SQLite单文件，按产品编号索引，每条响应zlib压缩）
+
+    录制模式下 DigiKeyClient 将每次查询的原始响应写入归档，回放模式下直接从归档返回，
+    不发出任何网络请求。查询失败（返回None）同样会被录制，保证回放结果与录制时一致。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                product_number TEXT NOT NULL,
+                manufacturer_id TEXT NOT NULL DEFAULT '',
+                body BLOB,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (product_number, manufacturer_id)
+            )
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每个线程一个连接，录制时查询线程并发写入
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def put(self, product_number: str, details: Optional[Dict], manufacturer_id: Optional[str] = None) -> None:
+        """录制一条响应（None表示查询失败）"""
+        body = None
+        if details is not None:
+            body = zlib.compress(json.dumps(details, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        self._connect().execute(
+            "INSERT OR REPLACE INTO responses (product_number, manufacturer_id, body, recorded_at) VALUES (?, ?, ?, ?)",
+            (product_number, manufacturer_id or '', body, time())
+        )
+
+    def get(self, product_number: str, manufacturer_id: Optional[str] = None):
+        """返回录制的响应；录制的是失败结果时返回None，未录制时返回 MISSING"""
+        row = self._connect().execute(
+            "SELECT body FROM responses WHERE product_number = ? AND manufacturer_id = ?",
+            (product_number, manufacturer_id or '')
+        ).fetchone()
+        if row is None:
+            return MISSING
+        return None if row[0] is None else json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def failed_count(self) -> int:
+        """录制的失败结果数量"""
+        return self._connect().execute("SELECT COUNT(*) FROM responses WHERE body IS NULL").fetchone()[0]
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """按产品编号顺序遍历 (产品编号, 响应)"""
+        rows = self._connect().execute(
+            "SELECT product_number, body FROM responses ORDER BY product_number, manufacturer_id"
+        )
+        for product_number, body in rows:
+            yield product_number, None if body is None else json.loads(zlib.decompress(body).decode('utf-8'))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("用法: python response_archive.py <归档文件>")
+        sys.exit(1)
+    archive = ResponseArchive(sys.argv[1])
+    print(f"归档文件: {sys.argv[1]}")
+    print(f"响应数: {len(archive)}（失败 {archive.failed_count()}）")
+    print(f"文件大小: {os.path.getsize(sys.argv[1]) / 1024:.1f} KB")
@@ -0,0 +1,222 @@
+import os
+import sys
+import gzip
+import json
+import shutil
+import logging
+import threading
+from time import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Tuple, Optional
+from datetime import datetime
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('result_stream')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 结果文件目录（多进程部署时应指向共享目录）
+RESULTS_DIR = os.getenv('RESULTS_DIR', 'results')
+# 是否默认使用gzip压缩结果文件
+RESULT_COMPRESS = os.getenv('RESULT_COMPRESS', '0') == '1'
+# 两次刷新到磁盘之间的最长间隔（秒），保证任务进行中也能下载到部分结果
+FLUSH_INTERVAL = 1.0
+# 内存中最多保留的已完成任务结果数量，以及单个结果可缓存的最大记录数
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '8'))
+RESULT_CACHE_MAX_RECORDS = int(os.getenv('RESULT_CACHE_MAX_RECORDS', '50000'))
+
+
+def result_path(name: str, compress: bool = None) -> str:
+    """返回任务结果文件路径: results/<name>.ndjson[.gz]"""
+    if compress is None:
+        compress = RESULT_COMPRESS
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    return os.path.join(RESULTS_DIR, f"{name}.ndjson" + ('.gz' if compress else ''))
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class ResultStreamWriter:
+    """
+    以紧凑的NDJSON格式逐条写入查询结果，每行: {"product_number": ..., "status": ..., ...}
+    文件名以 .gz 结尾时使用gzip压缩；已存在的同名文件（任务重试）会被覆盖
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = _open(path, 'w')
+        self._last_flush = time()
+
+    def write(self, product_number: str, result: Dict) -> None:
+        record = {'product_number': product_number}
+        record.update(result)
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+        if time() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._last_flush = time()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"结果文件已写入 {self.count} 条记录: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_results(path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    逐条读取NDJSON结果文件，返回 (产品编号, 结果字典)
+    任务进行中读取时，忽略末尾尚未写完的记录
+    """
+    with _open(path, 'r') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                record = json.loads(line)
+                yield record.pop('product_number'), record
+        except EOFError:
+            # gzip文件仍在写入，尚无结束标记
+            return
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    """将NDJSON结果文件读取为 {产品编号: 结果} 字典"""
+    return dict(iter_results(path))
+
+
+def resolve_result_path(path: Optional[str]) -> Optional[str]:
+    """返回结果文件的实际路径（已被压缩转存时返回 .gz 文件），文件不存在时返回None"""
+    if not path:
+        return None
+    if os.path.exists(path):
+        return path
+    if not path.endswith('.gz') and os.path.exists(path + '.gz'):
+        return path + '.gz'
+    return None
+
+
+def compress_result_file(path: str) -> str:
+    """
+    将已完成的NDJSON结果文件转存为gzip压缩文件并删除原文件
+    :return: 压缩文件路径
+    """
+    if path.endswith('.gz'):
+        return path
+    gz_path = path + '.gz'
+    tmp_path = f"{gz_path}.{os.getpid()}.tmp"
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, gz_path)
+    try:
+        os.remove(path)
+    except OSError as e:
+        # Windows下文件正在被下载时无法删除，下次清理时再删
+        logger.warning(f"删除已压缩的结果文件失败: {path} - {e}")
+    logger.info(f"结果文件已压缩转存: {gz_path}")
+    return gz_path
+
+
+class ResultCache:
+    """
+    已完成任务结果的LRU缓存
+
+    只在内存中保留最近使用的 max_entries 个结果，其余按需从磁盘（含压缩转存的文件）重新读取，
+    保证长时间运行的Web服务内存占用不随任务数量增长。
+    """
+
+    def __init__(self, max_entries: int = None, max_records: int = None):
+        self.max_entries = RESULT_CACHE_SIZE if max_entries is None else max_entries
+        self.max_records = RESULT_CACHE_MAX_RECORDS if max_records is None else max_records
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Dict[str, Dict]:
+        """读取结果文件，文件不存在时返回空字典"""
+        actual_path = resolve_result_path(path)
+        if actual_path is None:
+            return {}
+        key = path[:-3] if path.endswith('.gz') else path
+        mtime = os.path.getmtime(actual_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == (actual_path, mtime):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        results = load_results(actual_path)
+        if self.max_entries > 0 and len(results) <= self.max_records:
+            with self._lock:
+                self._entries[key] = ((actual_path, mtime), results)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return results
+
+    def discard(self, path: str) -> None:
+        key = path[:-3] if path.endswith('.gz') else path
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def iter_legacy_json(path: str) -> Iterator[str]:
+    """以旧版 product_details.json 格式（indent=2 的字典）逐段生成JSON文本"""
+    yield '{'
+    seen = set()
+    for product_number, result in iter_results(path):
+        if product_number in seen:
+            continue
+        # 取单项字典序列化结果的内部部分，与 json.dump(results, indent=2) 的输出一致
+        item = json.dumps({product_number: result}, ensure_ascii=False, indent=2)[2:-2]
+        yield (',\n' if seen else '\n') + item
+        seen.add(product_number)
+    yield '\n}' if seen else '}'
+
+
+def write_legacy_json(path: str, output_path: str) -> None:
+    """将NDJSON结果文件转换为旧版JSON格式"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for chunk in iter_legacy_json(path):
+            f.write(chunk)
+    logger.info(f"已转换为旧版JSON格式: {output_path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("用法: python result_stream.py <结果文件.ndjson[.gz]> <输出文件.json>")
+        sys.exit(1)
+    write_legacy_json(sys.argv[1], sys.argv[2])
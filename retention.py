@@ -0,0 +1,148 @@
+import os
+import threading
+import logging
+from time import time
+from datetime import datetime
+from job_queue import JobQueue
+from job_store import JobStore
+from result_stream import RESULTS_DIR, compress_result_file
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('retention')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 结果文件最后一次写入后多久（秒）压缩转存
+RESULT_SPILL_AFTER = int(os.getenv('RESULT_SPILL_AFTER', '600'))
+# 上传文件、结果文件和任务记录的保留天数
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', '7'))
+# 清理间隔（秒）
+JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL', '600'))
+
+
+class Janitor:
+    """
+    定期清理已完成任务的数据：
+    - 结果文件在任务结束 RESULT_SPILL_AFTER 秒后压缩为 .ndjson.gz
+    - 超过 RETENTION_DAYS 天的上传文件、结果文件、任务状态和队列记录被删除
+    排队或处理中的任务所用的文件不会被清理。多个进程同时运行时各操作可重复执行。
+    """
+
+    def __init__(self, job_store: JobStore, job_queue: JobQueue, upload_folder: str,
+                 results_dir: str = None, spill_after: int = None, retention_days: float = None,
+                 interval: int = None):
+        self.job_store = job_store
+        self.job_queue = job_queue
+        self.upload_folder = upload_folder
+        self.results_dir = results_dir or RESULTS_DIR
+        self.spill_after = RESULT_SPILL_AFTER if spill_after is None else spill_after
+        self.retention_days = RETENTION_DAYS if retention_days is None else retention_days
+        self.interval = interval or JANITOR_INTERVAL
+        self._stop_event = threading.Event()
+
+    def _is_active(self, job_id: str) -> bool:
+        job = self.job_store.get(job_id)
+        return bool(job and job['is_processing'])
+
+    def spill_results(self) -> int:
+        """压缩转存已完成任务的结果文件，返回转存数量"""
+        if not os.path.isdir(self.results_dir):
+            return 0
+        cutoff = time() - self.spill_after
+        count = 0
+        for name in os.listdir(self.results_dir):
+            if not name.endswith('.ndjson'):
+                continue
+            path = os.path.join(self.results_dir, name)
+            job_id = name[:-len('.ndjson')]
+            try:
+                if os.path.getmtime(path) >= cutoff or self._is_active(job_id):
+                    continue
+                gz_path = compress_result_file(path)
+            except FileNotFoundError:
+                # 其他进程已处理
+                continue
+            except OSError as e:
+                logger.warning(f"压缩结果文件失败: {path} - {e}")
+                continue
+            job = self.job_store.get(job_id)
+            if job and job['result_path'] == path:
+                self.job_store.update(job_id, result_path=gz_path)
+            count += 1
+        return count
+
+    def expire(self) -> int:
+        """删除超过保留期限的文件和任务记录，返回删除的文件数量"""
+        cutoff = time() - self.retention_days * 86400
+        protected = {os.path.join(self.upload_folder, name) for name in self.job_store.active_filenames()}
+        removed = 0
+        for folder in (self.upload_folder, self.results_dir):
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if path in protected or not os.path.isfile(path):
+                    continue
+                stem = name.split('.', 1)[0]
+                try:
+                    if os.path.getmtime(path) >= cutoff or (folder == self.results_dir and self._is_active(stem)):
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    continue
+
+        jobs_removed = 0
+        while True:
+            expired = self.job_store.finished_before(cutoff)
+            if not expired:
+                break
+            jobs_removed += self.job_store.delete([job['job_id'] for job in expired])
+        self.job_queue.purge(cutoff)
+        if removed or jobs_removed:
+            logger.info(f"已清理 {removed} 个过期文件, {jobs_removed} 条任务记录")
+        return removed
+
+    def run_once(self):
+        spilled = self.spill_results()
+        if spilled:
+            logger.info(f"已压缩转存 {spilled} 个结果文件")
+        self.expire()
+
+    def run(self):
+        logger.info(f"数据清理启动: 结果 {self.spill_after} 秒后压缩, 保留 {self.retention_days} 天")
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"数据清理出错: {e}", exc_info=True)
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,120 @@
+import os
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('lookup_scheduler')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+
+class LookupScheduler:
+    """
+    多任务共享的查询调度器
+
+    每个任务有独立的请求队列，查询线程按权重轮询（weighted round-robin）从各任务队列取请求：
+    权重为N的任务每轮最多连续处理N个请求，然后轮到下一个任务。
+    大任务不会独占查询线程，小任务的完成时间只取决于自身的大小。
+    """
+
+    def __init__(self, fetch, concurrency: int = 4):
+        """
+        :param fetch: 查询函数，参数为产品编号
+        :param concurrency: 查询线程数（同时进行的API请求数）
+        """
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()
+        self._weights = {}
+        self._credits = {}
+        self._threads = []
+
+    def register(self, job_id: str, weight: int = 1) -> None:
+        """登记任务及其权重"""
+        with self._cond:
+            self._queues.setdefault(job_id, deque())
+            self._weights[job_id] = max(1, int(weight))
+            self._credits[job_id] = self._weights[job_id]
+            # 首次使用时启动查询线程
+            while len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def unregister(self, job_id: str) -> None:
+        """注销任务，取消其尚未开始的请求"""
+        with self._cond:
+            pending = self._queues.pop(job_id, deque())
+            self._weights.pop(job_id, None)
+            self._credits.pop(job_id, None)
+        for _, future in pending:
+            future.cancel()
+
+    def submit(self, job_id: str, product_number: str) -> Future:
+        """提交查询请求，返回Future"""
+        future = Future()
+        with self._cond:
+            self._queues[job_id].append((product_number, future))
+            self._cond.notify()
+        return future
+
+    def pending_count(self, job_id: str) -> int:
+        with self._cond:
+            return len(self._queues.get(job_id, ()))
+
+    def _next_request(self):
+        """按权重轮询选出下一个请求（调用方持有锁）"""
+        for _ in range(len(self._queues)):
+            job_id, queue = next(iter(self._queues.items()))
+            if queue and self._credits[job_id] > 0:
+                self._credits[job_id] -= 1
+                item = queue.popleft()
+                if self._credits[job_id] == 0 or not queue:
+                    self._credits[job_id] = self._weights[job_id]
+                    self._queues.move_to_end(job_id)
+                return item
+            self._credits[job_id] = self._weights[job_id]
+            self._queues.move_to_end(job_id)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item = self._next_request()
+                while item is None:
+                    self._cond.wait()
+                    item = self._next_request()
+
+            product_number, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.fetch(product_number))
+            except Exception as e:
+                logger.error(f"查询 {product_number} 时发生错误: {e}")
+                future.set_exception(e)
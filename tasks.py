@@ -0,0 +1,284 @@
+import os
+import logging
+import openpyxl
+from collections import deque
+from datetime import datetime
+from digikey import get_default_client, parse_product_result, ADAPTIVE_ENABLED, ADAPTIVE_MAX
+from response_archive import MODE_RECORD, MODE_REPLAY
+from time import time, sleep
+from write_excel import read_excel_data, IncrementalExcelWriter
+from job_store import JobStore, CONTROL_PAUSE, CONTROL_CANCEL
+from result_stream import ResultStreamWriter, result_path, iter_results
+from history import append_run
+from watchlist import WatchList
+from scheduler import LookupScheduler
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('digikey_task')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 上传文件目录（工作进程可通过环境变量指向共享目录）
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+
+# 多进程共享的任务状态存储
+job_store = JobStore()
+
+# 关注零件缓存，由后台刷新保持最新
+watch_list = WatchList()
+
+# 进度写入共享存储的最小间隔（秒），避免每个产品都写一次数据库
+STATUS_UPDATE_INTERVAL = 0.5
+
+# 部分结果文件的保存频率：每N行或每T秒
+PARTIAL_SAVE_ROWS = int(os.getenv('PARTIAL_SAVE_ROWS', '500'))
+PARTIAL_SAVE_SECONDS = int(os.getenv('PARTIAL_SAVE_SECONDS', '60'))
+
+# 每个进程的查询线程数，以及每个任务最多未完成的查询数
+# 启用自适应并发时，实际同时进行的请求数由 DigiKeyClient 的并发控制器决定，线程数只是上限
+LOOKUP_CONCURRENCY = int(os.getenv('LOOKUP_CONCURRENCY', str(ADAPTIVE_MAX if ADAPTIVE_ENABLED else 4)))
+LOOKUP_WINDOW = int(os.getenv('LOOKUP_WINDOW', str(LOOKUP_CONCURRENCY * 2)))
+
+# 字段映射
+FIELD_MAPPING = {
+    'status': '状态',
+    'description': '描述',
+    'manufacturer': '制造商',
+    'product_url': '产品链接',
+    'datasheet_url': '数据手册',
+    'quantity_available': '可用数量'
+}
+
+
+def _lookup(product_number):
+    """查询单个产品，优先使用关注零件的缓存数据（回放归档时除外），返回 (响应, 是否来自缓存)"""
+    client = get_default_client()
+    if client.archive_mode != MODE_REPLAY:
+        details = watch_list.get_cached(product_number)
+        if details is not None:
+            if client.archive_mode == MODE_RECORD:
+                # 缓存命中的零件同样录制，保证回放时结果完整
+                client.archive.put(product_number, details)
+            return details, True
+    details = client.get_product_details(product_number)
+    if isinstance(details, dict) and details.get('Product') and watch_list.is_watched(product_number):
+        watch_list.put_cached(product_number, details)
+    return details, False
+
+
+# 本进程所有任务共享的查询调度器
+lookup_scheduler = LookupScheduler(_lookup, concurrency=LOOKUP_CONCURRENCY)
+
+
+def _wait_while_paused(job_id, pending, consume):
+    """
+    检查任务控制指令；暂停时先处理完已提交的请求，然后等待恢复或取消
+    :return: 最新的控制指令
+    """
+    control = job_store.get_control(job_id)
+    if control != CONTROL_PAUSE:
+        return control
+    
+    while pending:
+        consume(*pending.popleft())
+    logger.info(f"任务 {job_id} 已暂停")
+    _report(job_id, state='paused', message='任务已暂停')
+    while control == CONTROL_PAUSE:
+        sleep(1)
+        control = job_store.get_control(job_id)
+    if control != CONTROL_CANCEL:
+        logger.info(f"任务 {job_id} 已恢复")
+        _report(job_id, state='processing', message='任务已恢复，继续处理...')
+    return control
+
+
+def _report(job_id, **fields):
+    """将任务状态写入共享存储（未指定任务ID时忽略）"""
+    if job_id:
+        job_store.update(job_id, **fields)
+
+
+def process_products_task(filename, sheet_name, column_name, result_column_name=None, selected_fields=None, custom_headers=None, upload_folder=None, job_id=None, priority=1, stop_event=None):
+    """
+    处理产品数据的任务函数
+    :param priority: 任务优先级，同时也是共享查询调度中的权重（至少为1）
+    :param stop_event: 被设置时（例如租约丢失、任务已由其他工作进程接管）立即停止，不保存Excel、不再更新任务状态
+    :return: 处理结果字典（status: success / error / cancelled / stopped, message）
+    """
+    # 如果没有提供选择字段，则默认选择所有字段
+    if selected_fields is None:
+        selected_fields = ['status', 'description', 'manufacturer', 'product_url', 'datasheet_url', 'quantity_available']
+    
+    # 如果没有提供自定义表头，则使用默认表头
+    if custom_headers is None:
+        custom_headers = {}
+    
+    logger.info(f"开始处理产品数据，文件: {filename}, 工作表: {sheet_name}, 列名: {column_name}, 结果列名: {result_column_name}")
+    logger.info(f"选择的数据字段: {selected_fields}")
+    logger.info(f"自定义表头: {custom_headers}")
+    
+    try:
+        _report(job_id, state='processing', progress=0, message='正在读取产品数据...')
+        
+        filepath = os.path.join(upload_folder or UPLOAD_FOLDER, filename)
+        # 读取数据并获取表头行号
+        # 工作簿只加载一次，读取产品编号和写入结果共用
+        workbook = openpyxl.load_workbook(filepath)
+        data, header_row, header_column = read_excel_data(filepath, sheet_name, column_name,
+                                                          return_header_info=True, workbook=workbook)
+        
+        if not data:
+            logger.warning("未获取到有效的产品数据")
+            _report(job_id, state='failed', message='未获取到有效的产品数据')
+            return {'status': 'error', 'message': '未获取到有效的产品数据'}
+        
+        # 写入Excel，使用用户指定的列名或自动生成
+        output_column = result_column_name if result_column_name else f"{column_name}_状态"
+        
+        # 为每个选择的字段创建列，使用自定义表头或默认表头
+        fields = [field for field in selected_fields if field in FIELD_MAPPING]
+        headers = [custom_headers.get(field, f"{output_column}_{FIELD_MAPPING[field]}") for field in fields]
+        if not headers:
+            error_msg = '写入Excel失败: 列数据字典不能为空'
+            logger.error(error_msg)
+            _report(job_id, state='failed', message=error_msg)
+            return {'status': 'error', 'message': error_msg}
+        
+        total = len(data)
+        stream_path = result_path(job_id or datetime.now().strftime('%Y%m%d_%H%M%S'))
+        logger.info(f"共读取到 {total} 个产品数据")
+        _report(job_id, total_products=total, message=f'开始处理 {total} 个产品...', result_path=stream_path)
+        
+        # 查询结果逐行交给写入线程，定期保存部分结果文件供下载
+        stem, ext = os.path.splitext(filepath)
+        writer = IncrementalExcelWriter(
+            filepath, sheet_name, headers, header_row,
+            partial_path=f"{stem}.partial{ext}",
+            save_every_rows=PARTIAL_SAVE_ROWS,
+            save_every_seconds=PARTIAL_SAVE_SECONDS,
+            on_partial_save=lambda path, rows: _report(job_id, partial_path=path),
+            workbook=workbook
+        )
+        
+        success_count = 0
+        failure_count = 0
+        cache_hits = 0
+        last_report = 0
+        last_control_check = 0
+        cancelled = False
+        stopped = False
+        seen = set()
+        
+        # 查询请求交给共享调度器，与其他任务按权重轮流使用查询线程
+        # 每个任务最多保留 LOOKUP_WINDOW 个未完成的请求，结果按原顺序处理
+        scheduler_key = job_id or f"local-{id(data)}"
+        lookup_scheduler.register(scheduler_key, weight=max(1, priority))
+        pending = deque()
+        
+        def consume(i, product_number, future):
+            nonlocal success_count, failure_count, cache_hits, last_report
+            try:
+                details, from_cache = future.result()
+            except Exception as e:
+                logger.error(f"产品 {product_number} 查询异常: {e}")
+                details, from_cache = None, False
+            cache_hits += from_cache
+            success, result = parse_product_result(details)
+            if success:
+                success_count += 1
+                logger.info(f"产品 {product_number} 状态查询成功: {result['status']}")
+            else:
+                failure_count += 1
+                logger.error(f"产品 {product_number} {result['status']}")
+            
+            if product_number not in seen:
+                stream.write(product_number, result)
+                seen.add(product_number)
+            writer.put(i - 1, [result.get(field, '') for field in fields])
+            
+            if time() - last_report >= STATUS_UPDATE_INTERVAL or i == total:
+                _report(job_id, current_product=product_number, progress=i / total * 100,
+                        concurrency_limit=get_default_client().concurrency_limit())
+                last_report = time()
+        
+        try:
+            with ResultStreamWriter(stream_path) as stream:
+                for i, product_number in enumerate(data, 1):
+                    if stop_event is not None and stop_event.is_set():
+                        stopped = True
+                        break
+                    if job_id and time() - last_control_check >= STATUS_UPDATE_INTERVAL:
+                        control = _wait_while_paused(job_id, pending, consume)
+                        last_control_check = time()
+                        if control == CONTROL_CANCEL:
+                            cancelled = True
+                            break
+                    
+                    logger.info(f"正在处理第 {i}/{total} 个产品: {product_number}")
+                    pending.append((i, product_number, lookup_scheduler.submit(scheduler_key, product_number)))
+                    while len(pending) >= LOOKUP_WINDOW:
+                        consume(*pending.popleft())
+                
+                if not cancelled and not stopped:
+                    while pending:
+                        consume(*pending.popleft())
+        finally:
+            lookup_scheduler.unregister(scheduler_key)
+            if stopped:
+                writer.abort()
+            else:
+                _report(job_id, message='正在保存Excel...')
+                write_result = writer.close()
+        
+        if stopped:
+            logger.warning(f"任务 {job_id} 已停止，已完成 {writer.rows_written} 行，未保存Excel")
+            return {'status': 'stopped', 'message': '任务已停止'}
+        
+        logger.info(f"产品处理完成，成功: {success_count}, 失败: {failure_count}, 缓存命中: {cache_hits}")
+        _report(job_id, partial_path=None)
+        
+        if isinstance(write_result, dict) and write_result.get('status') == 'error':
+            error_msg = f'写入Excel失败: {write_result.get("message")}'
+            logger.error(error_msg)
+            _report(job_id, state='failed', message=error_msg)
+            return {'status': 'error', 'message': error_msg}
+        
+        if cancelled:
+            message = f'任务已取消，已完成的 {writer.rows_written} 行已写入Excel文件'
+            logger.info(message)
+            _report(job_id, state='cancelled', message=message, control=None)
+            return {'status': 'cancelled', 'message': message}
+        
+        logger.info("数据已成功写入Excel文件")
+        # 回放归档的结果不是新的查询数据，不计入历史记录
+        if get_default_client().archive_mode != MODE_REPLAY:
+            append_run(iter_results(stream_path), 'web', run_id=job_id)
+        _report(job_id, state='done', message=f'数据已成功写入Excel文件')
+        return {'status': 'success', 'message': f"成功处理 {len(seen)} 个产品"}
+        
+    except Exception as e:
+        error_msg = f'处理过程中发生错误: {str(e)}'
+        logger.error(error_msg, exc_info=True)
+        _report(job_id, state='failed', message=error_msg)
+        return {'status': 'error', 'message': error_msg}
@@ -0,0 +1,244 @@
+import os
+import io
+import csv
+import gzip
+import codecs
+import shutil
+import zlib
+import zipfile
+import tempfile
+import logging
+from datetime import datetime
+import openpyxl
+from openpyxl.utils.exceptions import IllegalCharacterError
+from flask import Request
+from werkzeug.utils import secure_filename
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('upload_handler')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 上传大小上限（MB）
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '200'))
+# 小于该大小（字节）的上传保留在内存中，更大的边接收边写入上传目录
+UPLOAD_MEMORY_LIMIT = int(os.getenv('UPLOAD_MEMORY_LIMIT', str(1024 * 1024)))
+# 复制和解压时的块大小
+CHUNK_SIZE = 1024 * 1024
+
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xls')
+TABLE_EXTENSIONS = WORKBOOK_EXTENSIONS + ('.csv',)
+# CSV转换后的工作表名称
+CSV_SHEET_NAME = 'Sheet1'
+# Excel工作表的最大行数
+EXCEL_MAX_ROWS = 1048576
+
+
+class UploadError(Exception):
+    """上传文件无法处理（类型不支持、压缩包内容无效等）"""
+
+
+def is_allowed_upload(filename: str) -> bool:
+    """支持 .xlsx/.xls/.csv，以及它们的 .gz 压缩文件和包含它们的 .zip 文件"""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.endswith(TABLE_EXTENSIONS + ('.zip',))
+
+
+class UploadRequest(Request):
+    """
+    小文件在内存中接收，大文件直接分块写入上传目录的临时文件，保存时只需重命名
+    请求结束时删除未被保存的临时文件（文件类型不支持、处理失败等）
+    """
+
+    upload_folder = 'uploads'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_temp_files = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_MEMORY_LIMIT:
+            return io.BytesIO()
+        os.makedirs(self.upload_folder, exist_ok=True)
+        stream = tempfile.NamedTemporaryFile('w+b', dir=self.upload_folder, prefix='.upload-', delete=False)
+        self._upload_temp_files.append(stream.name)
+        return stream
+
+    def close(self):
+        super().close()
+        for path in self._upload_temp_files:
+            if os.path.exists(path):
+                _remove_quietly(path)
+
+
+class _SizeLimitedReader(io.RawIOBase):
+    """读取时统计字节数，超过上限时抛出 UploadError（防止小压缩包解压出超大文件）"""
+
+    def __init__(self, source, limit: int):
+        self._source = source
+        self._limit = limit
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.bytes_read > self._limit:
+            raise UploadError(f'文件超过 {MAX_UPLOAD_MB} MB')
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _limited(source):
+    return io.BufferedReader(_SizeLimitedReader(source, MAX_UPLOAD_MB * 1024 * 1024), CHUNK_SIZE)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _copy_to(source, dest_path: str) -> None:
+    tmp_path = dest_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(_limited(source), f, CHUNK_SIZE)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def _detect_csv_encoding(source) -> str:
+    """根据文件开头判断编码（UTF-8 或 GBK），读取后回到文件开头"""
+    sample = source.read(CHUNK_SIZE)
+    source.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=len(sample) < CHUNK_SIZE)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+
+def _csv_to_xlsx(source, dest_path: str) -> None:
+    """将CSV逐行转换为单工作表的xlsx（结果需要写回Excel）；支持 UTF-8 和 GBK 编码"""
+    encoding = _detect_csv_encoding(source)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(CSV_SHEET_NAME)
+    tmp_path = dest_path + '.tmp'
+    try:
+        text = io.TextIOWrapper(_limited(source), encoding=encoding, newline='')
+        for line_number, row in enumerate(csv.reader(text), 1):
+            if line_number > EXCEL_MAX_ROWS:
+                raise UploadError(f'CSV文件超过Excel的最大行数 {EXCEL_MAX_ROWS}')
+            try:
+                sheet.append(row)
+            except IllegalCharacterError:
+                raise UploadError(f'CSV第 {line_number} 行包含Excel不支持的控制字符')
+        workbook.save(tmp_path)
+        os.replace(tmp_path, dest_path)
+    except UnicodeDecodeError:
+        raise UploadError('CSV文件编码无法识别（支持 UTF-8 和 GBK）')
+    except csv.Error as e:
+        raise UploadError(f'CSV文件格式错误: {e}')
+    finally:
+        if not sheet.closed:
+            # 转换中止时结束工作表的临时写入
+            try:
+                sheet.close()
+            except Exception:
+                pass
+        _remove_quietly(tmp_path)
+
+
+def _open_zip_member(stream):
+    """返回zip中第一个表格文件的 (文件名, 文件对象)"""
+    archive = zipfile.ZipFile(stream)
+    for info in archive.infolist():
+        base = os.path.basename(info.filename)
+        if not info.is_dir() and not base.startswith(('~$', '.')) and base.lower().endswith(TABLE_EXTENSIONS):
+            return base, archive.open(info)
+    raise UploadError('压缩包中没有 .xlsx/.xls/.csv 文件')
+
+
+def save_upload(file_storage, upload_folder: str) -> dict:
+    """
+    保存上传文件到上传目录，按需解压（.gz/.zip）并将CSV转换为xlsx
+    :return: {'filename': 保存后的文件名, 'sheets': 工作表名称列表}
+    """
+    name = secure_filename(file_storage.filename)
+    stream = file_storage.stream
+    tmp_name = getattr(stream, 'name', None)
+    try:
+        stream.seek(0)
+        if name.lower().endswith('.zip'):
+            name, source = _open_zip_member(stream)
+            name = secure_filename(name)
+        elif name.lower().endswith('.gz'):
+            name = name[:-3]
+            source = gzip.GzipFile(fileobj=stream, mode='rb')
+        else:
+            source = stream
+
+        if not name.lower().endswith(TABLE_EXTENSIONS):
+            raise UploadError('不支持的文件类型')
+
+        if name.lower().endswith('.csv'):
+            name = name[:-4] + '.xlsx'
+            dest_path = os.path.join(upload_folder, name)
+            _csv_to_xlsx(source, dest_path)
+        else:
+            dest_path = os.path.join(upload_folder, name)
+            if source is stream and isinstance(tmp_name, str) and \
+                    os.path.dirname(os.path.abspath(tmp_name)) == os.path.abspath(upload_folder):
+                # 已边接收边写入上传目录，直接重命名，不再复制
+                stream.close()
+                os.replace(tmp_name, dest_path)
+                tmp_name = None
+            else:
+                _copy_to(source, dest_path)
+    except (OSError, zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise UploadError(f'文件解压或保存失败: {e}')
+    finally:
+        if isinstance(tmp_name, str) and os.path.exists(tmp_name):
+            stream.close()
+            os.remove(tmp_name)
+
+    sheets = []
+    if name.lower().endswith('.xlsx'):
+        try:
+            workbook = openpyxl.load_workbook(dest_path, read_only=True)
+            sheets = workbook.sheetnames
+            workbook.close()
+        except Exception as e:
+            os.remove(dest_path)
+            raise UploadError(f'无法读取Excel文件: {e}')
+    logger.info(f"上传文件已保存: {dest_path}")
+    return {'filename': name, 'sheets': sheets}
@@ -0,0 +1,308 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from time import time
+from typing import Optional, Dict, List, Iterable
+from datetime import datetime
+from job_queue import DEFAULT_DB_PATH
+from digikey import get_default_client
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('watchlist')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 缓存数据被查询任务直接使用的最长时间（秒）
+PART_CACHE_MAX_AGE = int(os.getenv('PART_CACHE_MAX_AGE', str(24 * 3600)))
+# 后台刷新时段（本地时间，小时，左闭右开），例如 "1-6" 表示 01:00-06:00
+WATCH_REFRESH_WINDOW = os.getenv('WATCH_REFRESH_WINDOW', '1-6')
+# DigiKey API 每日配额，以及后台刷新可使用的比例
+DIGIKEY_DAILY_QUOTA = int(os.getenv('DIGIKEY_DAILY_QUOTA', '1000'))
+WATCH_QUOTA_SHARE = float(os.getenv('WATCH_QUOTA_SHARE', '0.3'))
+# 缓存数据早于该时间（秒）才需要刷新
+WATCH_MIN_REFRESH_AGE = int(os.getenv('WATCH_MIN_REFRESH_AGE', str(12 * 3600)))
+
+# 接近停产的状态，刷新时按"额外老化"处理以便优先刷新
+EOL_STATUSES = ('Obsolete', 'Not For New Designs', 'Last Time Buy', 'Discontinued at Digi-Key')
+EOL_PRIORITY_BONUS = 12 * 3600
+# 领取刷新任务后的占用时长（秒），失败的零件在此之后重新参与刷新
+CLAIM_TIMEOUT = 3600
+
+
+class WatchList:
+    """
+    关注零件列表和零件详情缓存（与任务队列共用同一个SQLite文件）
+
+    watched_parts: 需要后台保持最新的零件
+    part_cache: productdetails 原始响应缓存
+    watch_usage: 后台刷新每日已用的API调用次数（多进程共享配额）
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS watched_parts (
+                    product_number TEXT PRIMARY KEY,
+                    source TEXT,
+                    added_at REAL NOT NULL,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS part_cache (
+                    product_number TEXT PRIMARY KEY,
+                    details TEXT NOT NULL,
+                    product_status TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS watch_usage (
+                    day TEXT PRIMARY KEY,
+                    calls INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+        finally:
+            conn.close()
+
+    def add_parts(self, product_numbers: Iterable[str], source: str = '') -> int:
+        """添加关注零件，返回新增数量"""
+        now = time()
+        rows = [(p, source, now) for p in dict.fromkeys(p.strip() for p in product_numbers) if p]
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO watched_parts (product_number, source, added_at) VALUES (?, ?, ?)", rows
+            )
+            conn.execute("COMMIT")
+            added = conn.total_changes - before
+        finally:
+            conn.close()
+        logger.info(f"关注列表新增 {added} 个零件（来源: {source or '未指定'}）")
+        return added
+
+    def remove_parts(self, product_numbers: Iterable[str]) -> int:
+        """取消关注零件，返回删除数量"""
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            conn.executemany("DELETE FROM watched_parts WHERE product_number = ?", [(p,) for p in product_numbers])
+            return conn.total_changes - before
+        finally:
+            conn.close()
+
+    def list_parts(self, limit: int = 100, offset: int = 0) -> Dict:
+        """分页列出关注零件及其缓存状态"""
+        conn = self._connect()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM watched_parts").fetchone()[0]
+            rows = conn.execute(
+                "SELECT w.product_number, w.source, w.added_at, c.product_status, c.fetched_at "
+                "FROM watched_parts w LEFT JOIN part_cache c ON c.product_number = w.product_number "
+                "ORDER BY w.product_number LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {'total': total, 'parts': [dict(row) for row in rows]}
+
+    def get_cached(self, product_number: str, max_age: Optional[int] = None) -> Optional[Dict]:
+        """返回未过期的缓存响应，没有时返回None"""
+        max_age = PART_CACHE_MAX_AGE if max_age is None else max_age
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT details FROM part_cache WHERE product_number = ? AND fetched_at >= ?",
+                (product_number, time() - max_age)
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row['details']) if row else None
+
+    def put_cached(self, product_number: str, details: Dict) -> None:
+        """写入零件缓存"""
+        status = details.get('Product', {}).get('ProductStatus', {}).get('Status')
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO part_cache (product_number, details, product_status, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                (product_number, json.dumps(details, ensure_ascii=False, separators=(',', ':')), status, time())
+            )
+        finally:
+            conn.close()
+
+    def is_watched(self, product_number: str) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT 1 FROM watched_parts WHERE product_number = ?", (product_number,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def claim_due(self, limit: int) -> List[str]:
+        """
+        领取需要刷新的零件：从未获取的最优先，其次按缓存时间从旧到新，接近停产的零件额外提前
+        被领取的零件在 CLAIM_TIMEOUT 内不会被其他进程重复领取
+        """
+        now = time()
+        placeholders = ', '.join('?' for _ in EOL_STATUSES)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                f"SELECT w.product_number FROM watched_parts w "
+                f"LEFT JOIN part_cache c ON c.product_number = w.product_number "
+                f"WHERE w.claimed_until < ? AND COALESCE(c.fetched_at, 0) < ? "
+                f"ORDER BY COALESCE(c.fetched_at, 0) - "
+                f"CASE WHEN c.product_status IN ({placeholders}) THEN ? ELSE 0 END "
+                f"LIMIT ?",
+                (now, now - WATCH_MIN_REFRESH_AGE, *EOL_STATUSES, EOL_PRIORITY_BONUS, limit)
+            ).fetchall()
+            parts = [row['product_number'] for row in rows]
+            conn.executemany(
+                "UPDATE watched_parts SET claimed_until = ? WHERE product_number = ?",
+                [(now + CLAIM_TIMEOUT, p) for p in parts]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return parts
+
+    def release_claims(self, product_numbers: Iterable[str]) -> None:
+        """释放领取后未刷新的零件，使其可以立即被再次领取"""
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "UPDATE watched_parts SET claimed_until = 0 WHERE product_number = ?", [(p,) for p in product_numbers]
+            )
+        finally:
+            conn.close()
+
+    def reserve_call(self, daily_budget: int) -> bool:
+        """占用一次今日后台刷新配额，配额用尽时返回False"""
+        day = datetime.now().strftime('%Y%m%d')
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR IGNORE INTO watch_usage (day, calls) VALUES (?, 0)", (day,))
+            cursor = conn.execute(
+                "UPDATE watch_usage SET calls = calls + 1 WHERE day = ? AND calls < ?", (day, daily_budget)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+
+def in_refresh_window(window: str = None, now: datetime = None) -> bool:
+    """判断当前时间是否处于后台刷新时段，支持跨午夜（例如 "22-5"），起止相同表示全天"""
+    start, end = (int(h) for h in (window or WATCH_REFRESH_WINDOW).split('-'))
+    hour = (now or datetime.now()).hour
+    if start == end:
+        return True
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class WatchRefresher:
+    """在低峰时段按配额后台刷新关注零件的缓存"""
+
+    def __init__(self, watch_list: WatchList, client=None, daily_budget: int = None, window: str = None):
+        self.watch_list = watch_list
+        self.client = client or get_default_client()
+        self.daily_budget = daily_budget if daily_budget is not None else int(DIGIKEY_DAILY_QUOTA * WATCH_QUOTA_SHARE)
+        self.window = window or WATCH_REFRESH_WINDOW
+        start, end = (int(h) for h in self.window.split('-'))
+        window_hours = (end - start) % 24 or 24
+        # 将每日配额均匀分布在刷新时段内
+        self.call_interval = window_hours * 3600 / max(self.daily_budget, 1)
+        self._stop_event = threading.Event()
+
+    def refresh_once(self, batch_size: int = 10) -> int:
+        """刷新一批到期零件，返回实际调用API的次数"""
+        calls = 0
+        claimed = self.watch_list.claim_due(batch_size)
+        processed = 0
+        try:
+            for product_number in claimed:
+                if self._stop_event.is_set() or not in_refresh_window(self.window):
+                    break
+                if not self.watch_list.reserve_call(self.daily_budget):
+                    logger.info("今日后台刷新配额已用完")
+                    break
+                processed += 1
+                calls += 1
+                details = self.client.get_product_details(product_number)
+                if isinstance(details, dict) and details.get('Product'):
+                    self.watch_list.put_cached(product_number, details)
+                    logger.info(f"已刷新关注零件: {product_number}")
+                else:
+                    logger.warning(f"刷新关注零件失败: {product_number}")
+                self._stop_event.wait(self.call_interval)
+        finally:
+            # 时段结束、配额用完或停止时，未刷新的零件不必等待领取超时
+            if processed < len(claimed):
+                self.watch_list.release_claims(claimed[processed:])
+        return calls
+
+    def run(self):
+        logger.info(f"关注零件后台刷新启动: 时段 {self.window} 点, 每日配额 {self.daily_budget} 次")
+        while not self._stop_event.is_set():
+            calls = 0
+            if in_refresh_window(self.window):
+                try:
+                    calls = self.refresh_once()
+                except Exception as e:
+                    logger.error(f"后台刷新出错: {e}", exc_info=True)
+            if calls == 0:
+                self._stop_event.wait(60)
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,18 +1,26 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
-import sys
-import json
-import threading
-import time
+import uuid
 import logging
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from digikey import DigiKeyClient
-from write_excel import read_excel_data, write_excel_data, write_multiple_columns
+from datetime import datetime, date
+from write_excel import read_excel_data
+from job_queue import JobQueue
+from job_store import CONTROL_PAUSE, CONTROL_CANCEL
+from tasks import job_store, watch_list, UPLOAD_FOLDER
+from worker import start_embedded_workers
+from result_stream import ResultCache, resolve_result_path, iter_legacy_json
+from watchlist import WatchRefresher
+from retention import Janitor
+from history import lifecycle_report
+from upload_handler import UploadRequest, UploadError, save_upload, is_allowed_upload, MAX_UPLOAD_MB
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+# 大文件上传边接收边写入上传目录
+UploadRequest.upload_folder = UPLOAD_FOLDER
+app.request_class = UploadRequest
 
 # 配置日志
 log_dir = 'logs'
@@ -46,19 +54,30 @@ logger.info("Digi-Key 产品状态查询工具启动")
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# 全局变量存储处理状态
-processing_status = {
-    'is_processing': False,
-    'progress': 0,
-    'current_product': '',
-    'total_products': 0,
-    'message': '',
-    'results': {}
-}
+# 持久化任务队列，任务由工作进程（本进程内嵌或独立的 worker.py）领取处理
+job_queue = JobQueue()
+
+# 内嵌工作线程数量（即同时处理的任务数），设为0时仅由独立的 worker.py 进程处理任务
+# 各任务的查询请求由共享调度器按优先级权重轮流执行，API并发数由 LOOKUP_CONCURRENCY 控制
+embedded_workers = int(os.getenv('EMBEDDED_WORKERS', '4'))
+if embedded_workers > 0:
+    start_embedded_workers(embedded_workers, job_queue, app.config['UPLOAD_FOLDER'])
+    logger.info(f"已启动 {embedded_workers} 个内嵌工作线程")
+
+# 关注零件后台刷新（多进程部署时共享每日配额）
+if os.getenv('WATCH_REFRESH_ENABLED', '1') == '1':
+    WatchRefresher(watch_list).start()
+
+# 已完成任务的结果只在内存中保留最近使用的几个，其余按需从磁盘读取
+result_cache = ResultCache()
+
+# 定期压缩已完成任务的结果文件，清理过期的上传文件、结果文件和任务记录
+if os.getenv('JANITOR_ENABLED', '1') == '1':
+    Janitor(job_store, job_queue, app.config['UPLOAD_FOLDER']).start()
 
 def allowed_file(filename):
-    """检查文件扩展名是否允许"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'xlsx', 'xls'}
+    """检查文件扩展名是否允许（Excel、CSV及其gzip/zip压缩文件）"""
+    return is_allowed_upload(filename)
 
 @app.route('/')
 def index():
@@ -90,16 +109,19 @@ def upload_file():
         return jsonify({'status': 'error', 'message': '没有选择文件'})
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        logger.info(f"保存上传文件: {filename} 到 {filepath}")
-        file.save(filepath)
+        logger.info(f"保存上传文件: {file.filename} 到 {app.config['UPLOAD_FOLDER']}")
+        try:
+            saved = save_upload(file, app.config['UPLOAD_FOLDER'])
+        except UploadError as e:
+            logger.warning(f"上传文件处理失败: {e}")
+            return jsonify({'status': 'error', 'message': str(e)})
         
-        logger.info(f"文件 {filename} 上传成功")
+        logger.info(f"文件 {saved['filename']} 上传成功")
         return jsonify({
             'status': 'success', 
             'message': '文件上传成功',
-            'filename': filename
+            'filename': saved['filename'],
+            'sheets': saved['sheets']
         })
     
     logger.warning(f"不支持的文件类型: {file.filename}")
@@ -108,14 +130,8 @@ def upload_file():
 @app.route('/start_processing', methods=['POST'])
 def start_processing():
     """开始处理产品数据"""
-    global processing_status
-    
     logger.info("收到开始处理请求")
     
-    if processing_status['is_processing']:
-        logger.warning("已有任务正在处理中，拒绝新请求")
-        return jsonify({'status': 'error', 'message': '已有任务正在处理中'})
-    
     data = request.json
     filename = data.get('filename')
     sheet_name = data.get('sheet_name')
@@ -123,8 +139,12 @@ def start_processing():
     result_column_name = data.get('result_column_name')
     selected_fields = data.get('selected_fields', [])
     custom_headers = data.get('custom_headers', {})
+    try:
+        priority = max(0, int(data.get('priority') or 0))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': '优先级必须是非负整数'})
     
-    logger.info(f"处理参数 - 文件: {filename}, 工作表: {sheet_name}, 列名: {column_name}, 结果列名: {result_column_name}")
+    logger.info(f"处理参数 - 文件: {filename}, 工作表: {sheet_name}, 列名: {column_name}, 结果列名: {result_column_name}, 优先级: {priority}")
     logger.info(f"选择的数据字段: {selected_fields}")
     logger.info(f"自定义表头: {custom_headers}")
     
@@ -132,170 +152,114 @@ def start_processing():
         logger.warning("开始处理请求参数不完整")
         return jsonify({'status': 'error', 'message': '参数不完整'})
     
-    # 在新线程中运行处理任务
-    thread = threading.Thread(
-        target=process_products_task,
-        args=(filename, sheet_name, column_name, result_column_name, selected_fields, custom_headers)
-    )
-    thread.daemon = True
-    thread.start()
+    # 先登记任务状态，再加入持久化任务队列，由工作进程领取处理
+    job_id = uuid.uuid4().hex
+    job_store.create(job_id, filename=filename, message='任务已加入队列，等待处理...', priority=priority)
+    job_queue.enqueue({
+        'filename': filename,
+        'sheet_name': sheet_name,
+        'column_name': column_name,
+        'result_column_name': result_column_name,
+        'selected_fields': selected_fields,
+        'custom_headers': custom_headers
+    }, job_id=job_id, priority=priority)
     
-    logger.info("处理任务已启动")
-    return jsonify({'status': 'success', 'message': '处理任务已启动'})
+    logger.info(f"处理任务已加入队列: {job_id}")
+    return jsonify({'status': 'success', 'message': '处理任务已启动', 'job_id': job_id})
 
-def process_products_task(filename, sheet_name, column_name, result_column_name=None, selected_fields=None, custom_headers=None):
-    """处理产品数据的任务函数"""
-    global processing_status
-    
-    # 如果没有提供选择字段，则默认选择所有字段
-    if selected_fields is None:
-        selected_fields = ['status', 'description', 'manufacturer', 'product_url', 'datasheet_url', 'quantity_available']
-    
-    # 如果没有提供自定义表头，则使用默认表头
-    if custom_headers is None:
-        custom_headers = {}
-    
-    logger.info(f"开始处理产品数据，文件: {filename}, 工作表: {sheet_name}, 列名: {column_name}, 结果列名: {result_column_name}")
-    logger.info(f"选择的数据字段: {selected_fields}")
-    logger.info(f"自定义表头: {custom_headers}")
-    
-    try:
-        processing_status['is_processing'] = True
-        processing_status['progress'] = 0
-        processing_status['message'] = '正在读取产品数据...'
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        client = DigiKeyClient()
-        # 读取数据并获取表头行号
-        data, header_row, header_column = read_excel_data(filepath, sheet_name, column_name, return_header_info=True)
-        
-        if not data:
-            logger.warning("未获取到有效的产品数据")
-            processing_status['message'] = '未获取到有效的产品数据'
-            processing_status['is_processing'] = False
-            return
-        
-        results = {}
-        total = len(data)
-        logger.info(f"共读取到 {total} 个产品数据")
-        processing_status['total_products'] = total
-        processing_status['message'] = f'开始处理 {total} 个产品...'
-        
-        success_count = 0
-        failure_count = 0
-        
-        for i, product_number in enumerate(data, 1):
-            processing_status['current_product'] = product_number
-            processing_status['progress'] = i / total * 100
-            
-            logger.info(f"正在处理第 {i}/{total} 个产品: {product_number}")
-            
-            details = client.get_product_details(product_number)
-            if isinstance(details, dict) and details.get('Product'):
-                # 获取完整的产品信息
-                product = details.get('Product', {})
-                product_status = product.get('ProductStatus', {}).get('Status')
-                product_description = product.get('Description', {}).get('ProductDescription', '')
-                manufacturer = product.get('Manufacturer', {}).get('Name', '')
-                product_url = product.get('ProductUrl', '')
-                datasheet_url = product.get('DatasheetUrl', '')
-                quantity_available = product.get('QuantityAvailable', 0)
-                
-                if product_status:
-                    results[product_number] = {
-                        'status': product_status,
-                        'description': product_description,
-                        'manufacturer': manufacturer,
-                        'product_url': product_url,
-                        'datasheet_url': datasheet_url,
-                        'quantity_available': quantity_available
-                    }
-                    success_count += 1
-                    logger.info(f"产品 {product_number} 状态查询成功: {product_status}")
-                else:
-                    results[product_number] = {
-                        'status': "查询失败: 未找到状态信息",
-                        'description': '',
-                        'manufacturer': '',
-                        'product_url': '',
-                        'datasheet_url': '',
-                        'quantity_available': 0
-                    }
-                    failure_count += 1
-                    logger.warning(f"产品 {product_number} 未找到状态信息")
-            else:
-                results[product_number] = {
-                    'status': f"查询失败: {details if isinstance(details, str) else '未知错误'}",
-                    'description': '',
-                    'manufacturer': '',
-                    'product_url': '',
-                    'datasheet_url': '',
-                    'quantity_available': 0
-                }
-                failure_count += 1
-                logger.error(f"产品 {product_number} 查询失败: {details if isinstance(details, str) else '未知错误'}")
-        
-        logger.info(f"产品处理完成，成功: {success_count}, 失败: {failure_count}")
-        processing_status['message'] = '产品处理完成！正在保存结果...'
-        
-        # 保存结果到JSON文件
-        data_file = os.path.join(os.path.dirname(__file__), 'product_details.json')
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"结果已保存到JSON文件: {data_file}")
-        
-        # 写入Excel，使用用户指定的列名或自动生成
-        output_column = result_column_name if result_column_name else f"{column_name}_状态"
-        
-        # 准备多列数据，只包含用户选择的字段
-        columns_data = {}
-        
-        # 字段映射
-        field_mapping = {
-            'status': '状态',
-            'description': '描述',
-            'manufacturer': '制造商',
-            'product_url': '产品链接',
-            'datasheet_url': '数据手册',
-            'quantity_available': '可用数量'
-        }
-        
-        # 为每个选择的字段创建列
-        for field in selected_fields:
-            if field in field_mapping:
-                # 使用自定义表头或默认表头
-                header = custom_headers.get(field, f"{output_column}_{field_mapping[field]}")
-                columns_data[header] = [results.get(p, {}).get(field, '') for p in data]
-        
-        write_result = write_multiple_columns(filepath, sheet_name, columns_data, max_search_rows=10, reference_header=column_name, reference_header_row=header_row)
-        
-        if isinstance(write_result, dict) and write_result.get('status') == 'error':
-            error_msg = f'写入Excel失败: {write_result.get("message")}'
-            logger.error(error_msg)
-            processing_status['message'] = error_msg
-        else:
-            logger.info("数据已成功写入Excel文件")
-            processing_status['message'] = f'数据已成功写入Excel文件'
-        
-        processing_status['results'] = results
-        processing_status['is_processing'] = False
-        
-    except Exception as e:
-        error_msg = f'处理过程中发生错误: {str(e)}'
-        logger.error(error_msg, exc_info=True)
-        processing_status['message'] = error_msg
-        processing_status['is_processing'] = False
+def _find_job(job_id=None, finished=False):
+    """按任务ID查找任务状态；未指定时返回最近的任务（兼容单任务页面）"""
+    if job_id:
+        return job_store.get(job_id)
+    return job_store.latest_finished() if finished else job_store.latest()
 
 @app.route('/processing_status')
 def get_processing_status():
     """获取处理状态"""
     logger.debug("请求获取处理状态")
-    return jsonify(processing_status)
+    status = _find_job(request.args.get('job_id'))
+    if status is None:
+        if request.args.get('job_id'):
+            return jsonify({'status': 'error', 'message': '任务不存在'})
+        return jsonify({'is_processing': False, 'progress': 0, 'current_product': '',
+                        'total_products': 0, 'message': '', 'results': {}})
+    
+    # 结果只在任务结束后随状态返回一次，进行中的部分结果通过 /download_json 获取
+    status['results'] = {}
+    if not status['is_processing'] and status['result_path']:
+        status['results'] = result_cache.get(status['result_path'])
+    
+    # 工作进程崩溃且超过最大尝试次数时，任务状态以队列为准
+    if status['is_processing']:
+        job = job_queue.get(status['job_id'])
+        if job and job['state'] == 'failed':
+            status['is_processing'] = False
+            status['state'] = 'failed'
+            status['message'] = job['last_error'] or status['message']
+        elif job and job['state'] == 'leased' and status['state'] == 'queued':
+            status['message'] = f"任务正在由工作进程 {job['lease_owner']} 处理..."
+    
+    return jsonify(status)
+
+def _job_control_target():
+    """从请求中取得任务ID及其状态，任务不存在时返回错误响应"""
+    job_id = request.args.get('job_id') or (request.get_json(silent=True) or {}).get('job_id')
+    job = job_store.get(job_id) if job_id else None
+    if job is None:
+        return None, jsonify({'status': 'error', 'message': '任务不存在'})
+    if not job['is_processing']:
+        return None, jsonify({'status': 'error', 'message': '任务已结束'})
+    return job, None
+
+@app.route('/cancel_job', methods=['POST'])
+def cancel_job():
+    """取消任务：排队中的任务直接取消，处理中的任务在下一次检查时停止并保存已完成的行"""
+    job, error = _job_control_target()
+    if error:
+        return error
+    if job_queue.cancel(job['job_id']):
+        job_store.update(job['job_id'], state='cancelled', message='任务已取消', control=None)
+        return jsonify({'status': 'success', 'message': '任务已取消'})
+    job_store.update(job['job_id'], control=CONTROL_CANCEL, message='正在取消任务...')
+    logger.info(f"已请求取消任务: {job['job_id']}")
+    return jsonify({'status': 'success', 'message': '正在取消任务'})
+
+@app.route('/pause_job', methods=['POST'])
+def pause_job():
+    """暂停任务（排队中的任务开始处理后立即暂停）"""
+    job, error = _job_control_target()
+    if error:
+        return error
+    job_store.update(job['job_id'], control=CONTROL_PAUSE)
+    logger.info(f"已请求暂停任务: {job['job_id']}")
+    return jsonify({'status': 'success', 'message': '正在暂停任务'})
+
+@app.route('/resume_job', methods=['POST'])
+def resume_job():
+    """恢复已暂停的任务"""
+    job, error = _job_control_target()
+    if error:
+        return error
+    if job['control'] != CONTROL_PAUSE:
+        return jsonify({'status': 'error', 'message': '任务未暂停'})
+    job_store.update(job['job_id'], control=None)
+    logger.info(f"已请求恢复任务: {job['job_id']}")
+    return jsonify({'status': 'success', 'message': '任务已恢复'})
 
 @app.route('/download_result')
 def download_result():
-    """下载处理后的Excel文件"""
+    """下载处理后的Excel文件；任务进行中指定 job_id 和 partial=1 可下载部分结果"""
     filename = request.args.get('filename')
+    job_id = request.args.get('job_id')
+    if job_id and request.args.get('partial') == '1':
+        job = job_store.get(job_id)
+        if not job or not job['partial_path'] or not os.path.exists(job['partial_path']):
+            return jsonify({'status': 'error', 'message': '暂无部分结果'})
+        logger.info(f"下载部分结果文件: {job['partial_path']}")
+        return send_file(os.path.abspath(job['partial_path']), as_attachment=True)
+    if not filename and job_id:
+        job = job_store.get(job_id)
+        filename = job['filename'] if job else None
     if not filename:
         logger.warning("下载结果请求缺少文件名参数")
         return jsonify({'status': 'error', 'message': '参数不完整'})
@@ -306,19 +270,113 @@ def download_result():
         return jsonify({'status': 'error', 'message': '文件不存在'})
     
     logger.info(f"下载Excel文件: {filename}")
-    return send_file(filepath, as_attachment=True)
+    return send_file(os.path.abspath(filepath), as_attachment=True)
 
 @app.route('/download_json')
 def download_json():
-    """下载JSON结果文件"""
-    data_file = os.path.join(os.path.dirname(__file__), 'product_details.json')
-    if not os.path.exists(data_file):
+    """
+    下载JSON结果文件（任务进行中可下载已完成的部分）
+    format=ndjson（默认）返回逐行JSON，format=json 返回旧版 product_details.json 格式
+    """
+    job_id = request.args.get('job_id')
+    job = _find_job(job_id) if job_id else _find_job(finished=True)
+    # 结果文件可能已被压缩转存为 .gz
+    result_file = resolve_result_path(job['result_path']) if job else None
+    if result_file is None:
         logger.warning("下载的JSON结果文件不存在")
         return jsonify({'status': 'error', 'message': '结果文件不存在'})
     
-    logger.info("下载JSON结果文件")
-    return send_file(data_file, as_attachment=True, download_name='product_details.json')
+    logger.info(f"下载JSON结果文件: {result_file}")
+    if request.args.get('format') == 'json':
+        response = Response(iter_legacy_json(result_file), mimetype='application/json')
+        response.headers['Content-Disposition'] = 'attachment; filename=product_details.json'
+        return response
+    
+    mimetype = 'application/gzip' if result_file.endswith('.gz') else 'application/x-ndjson'
+    return send_file(os.path.abspath(result_file), as_attachment=True, mimetype=mimetype,
+                     download_name=os.path.basename(result_file), conditional=False)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """上传文件超过 MAX_UPLOAD_MB"""
+    logger.warning("上传文件超过大小限制")
+    return jsonify({'status': 'error', 'message': f'文件大小超过限制（{MAX_UPLOAD_MB}MB）'}), 413
+
+def _parse_datetime(value, end_of_day=False):
+    """解析ISO日期/时间；只有日期且 end_of_day 为True时取当天结束时刻"""
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value)
+    return datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+
+@app.route('/lifecycle')
+def lifecycle():
+    """
+    生命周期分析：since 之前与 [since, until] 期间各产品最后状态的对比
+    参数: since, until（ISO日期或时间，如 2026-07-01，只有日期的 until 包含当天全天），
+          status（可重复，默认接近停产的状态），limit（明细条数，默认100）
+    """
+    try:
+        since = _parse_datetime(request.args['since']) if request.args.get('since') else None
+        until = _parse_datetime(request.args['until'], end_of_day=True) if request.args.get('until') else None
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '参数格式错误，日期格式为 YYYY-MM-DD'})
+    report = lifecycle_report(since, until, request.args.getlist('status') or None, limit)
+    if report['status'] == 'success':
+        logger.info(f"生命周期分析完成: {report['products']} 个产品, {report['changed_count']} 个状态变化, 耗时 {report['elapsed_ms']} ms")
+    return jsonify(report)
+
+@app.route('/watchlist', methods=['GET'])
+def get_watchlist():
+    """列出关注零件及其缓存时间"""
+    limit = request.args.get('limit', 100, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify({'status': 'success', **watch_list.list_parts(limit, offset)})
+
+def _is_string_list(value):
+    """parts 参数必须是字符串列表（字符串会被逐字符处理）"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+@app.route('/watchlist', methods=['POST'])
+def add_watchlist():
+    """
+    添加关注零件：提供 parts 列表，或提供已上传的 filename/sheet_name/column_name 从BOM中读取
+    """
+    data = request.json or {}
+    parts = data.get('parts')
+    source = data.get('source', '')
+    if parts is not None and not _is_string_list(parts):
+        return jsonify({'status': 'error', 'message': 'parts 必须是字符串列表'})
+    
+    if not parts:
+        filename = data.get('filename')
+        sheet_name = data.get('sheet_name')
+        column_name = data.get('column_name')
+        if not all([filename, sheet_name, column_name]):
+            logger.warning("添加关注零件请求参数不完整")
+            return jsonify({'status': 'error', 'message': '参数不完整'})
+        try:
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            parts = read_excel_data(filepath, sheet_name, column_name)
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': str(e)})
+        source = source or f"{filename}/{sheet_name}"
+    
+    added = watch_list.add_parts(parts, source)
+    return jsonify({'status': 'success', 'message': f'新增 {added} 个关注零件', 'added': added})
+
+@app.route('/watchlist', methods=['DELETE'])
+def remove_watchlist():
+    """取消关注零件"""
+    parts = (request.json or {}).get('parts') or []
+    if not _is_string_list(parts):
+        return jsonify({'status': 'error', 'message': 'parts 必须是字符串列表'})
+    removed = watch_list.remove_parts(parts)
+    return jsonify({'status': 'success', 'message': f'已移除 {removed} 个关注零件', 'removed': removed})
 
 if __name__ == '__main__':
     logger.info("启动Flask应用服务器")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 开发服务器仅用于本地调试，生产环境请通过 wsgi.py 使用多进程WSGI服务器
+    app.run(debug=os.getenv('FLASK_DEBUG', '0') == '1', host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os
+import uuid
+import socket
+import argparse
+import threading
+import logging
+from datetime import datetime
+from job_queue import JobQueue
+from tasks import process_products_task, job_store, UPLOAD_FOLDER
+
+# 配置日志
+log_dir = 'logs'
+os.makedirs(log_dir, exist_ok=True)
+log_file = os.path.join(log_dir, f'digikey_{datetime.now().strftime("%Y%m%d")}.log')
+
+# 创建日志记录器
+logger = logging.getLogger('job_worker')
+logger.setLevel(logging.INFO)
+
+# 创建文件处理器
+file_handler = logging.FileHandler(log_file, encoding='utf-8')
+file_handler.setLevel(logging.INFO)
+
+# 创建控制台处理器
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+
+# 创建格式化器
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler.setFormatter(formatter)
+console_handler.setFormatter(formatter)
+
+# 添加处理器到日志记录器
+logger.addHandler(file_handler)
+logger.addHandler(console_handler)
+
+# 续约失败后的重试间隔（秒）
+HEARTBEAT_RETRY_INTERVAL = 5
+
+
+class Worker:
+    """从任务队列领取并处理任务的工作进程"""
+
+    def __init__(self, queue: JobQueue, worker_id: str = None, upload_folder: str = None, poll_interval: float = 2.0):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.upload_folder = upload_folder or UPLOAD_FOLDER
+        self.poll_interval = poll_interval
+
+    def run(self, stop_event: threading.Event = None, once: bool = False):
+        """
+        循环领取任务直到stop_event被设置
+        :param stop_event: 停止信号
+        :param once: 为True时队列为空即退出
+        """
+        stop_event = stop_event or threading.Event()
+        logger.info(f"工作进程启动: {self.worker_id}")
+        while not stop_event.is_set():
+            job = self.queue.lease(self.worker_id)
+            if job is None:
+                if once:
+                    break
+                stop_event.wait(self.poll_interval)
+                continue
+            self.process_job(job)
+        logger.info(f"工作进程退出: {self.worker_id}")
+
+    def process_job(self, job):
+        """处理单个任务，处理期间定期续约"""
+        job_id = job['job_id']
+        payload = job['payload']
+
+        # 心跳线程：在可见性超时的三分之一间隔续约，防止长任务被其他工作进程接管
+        # 续约出错（例如数据库被锁）时缩短间隔重试；租约已丢失时通知任务停止，避免与接管的工作进程同时写入
+        done = threading.Event()
+        lease_lost = threading.Event()
+
+        def keep_alive():
+            interval = self.queue.visibility_timeout / 3
+            wait = interval
+            while not done.wait(wait):
+                try:
+                    alive = self.queue.heartbeat(job_id, self.worker_id)
+                except Exception as e:
+                    logger.warning(f"任务 {job_id} 续约失败，稍后重试: {e}")
+                    wait = min(interval, HEARTBEAT_RETRY_INTERVAL)
+                    continue
+                wait = interval
+                if not alive:
+                    logger.warning(f"任务 {job_id} 租约已丢失，停止处理")
+                    lease_lost.set()
+                    break
+
+        heartbeat_thread = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat_thread.start()
+
+        try:
+            result = process_products_task(
+                payload.get('filename'),
+                payload.get('sheet_name'),
+                payload.get('column_name'),
+                payload.get('result_column_name'),
+                payload.get('selected_fields'),
+                payload.get('custom_headers'),
+                upload_folder=self.upload_folder,
+                job_id=job_id,
+                priority=job.get('priority') or payload.get('priority') or 1,
+                stop_event=lease_lost
+            )
+            if lease_lost.is_set():
+                # 任务已由其他工作进程接管，不再确认或更新状态
+                logger.warning(f"任务 {job_id} 已停止处理（租约丢失）")
+            elif result and result.get('status') in ('success', 'cancelled'):
+                self.queue.ack(job_id, self.worker_id)
+            else:
+                # 数据错误（表头不存在等）重试也不会成功
+                error = result.get('message', '未知错误') if result else '未知错误'
+                self.queue.nack(job_id, self.worker_id, error, retry=False)
+        except Exception as e:
+            logger.error(f"任务 {job_id} 处理异常: {e}", exc_info=True)
+            if lease_lost.is_set():
+                return
+            self.queue.nack(job_id, self.worker_id, str(e))
+            # 同步共享状态：可重试的任务回到排队状态
+            queued = (self.queue.get(job_id) or {}).get('state') == 'pending'
+            job_store.update(job_id, state='queued' if queued else 'failed', message=f'处理过程中发生错误: {e}')
+        finally:
+            done.set()
+
+
+def start_embedded_workers(count: int, queue: JobQueue = None, upload_folder: str = None):
+    """在当前进程中启动守护线程形式的工作进程"""
+    queue = queue or JobQueue()
+    stop_event = threading.Event()
+    for _ in range(count):
+        worker = Worker(queue, upload_folder=upload_folder)
+        thread = threading.Thread(target=worker.run, args=(stop_event,))
+        thread.daemon = True
+        thread.start()
+    return stop_event
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DigiKey 任务队列工作进程')
+    parser.add_argument('--upload-folder', help='上传文件目录（默认 UPLOAD_FOLDER 或 uploads）')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='队列为空时的轮询间隔（秒）')
+    parser.add_argument('--visibility-timeout', type=int, help='任务租约时长（秒）')
+    parser.add_argument('--once', action='store_true', help='处理完队列中的任务后退出')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='同时处理的任务数（各任务按优先级权重共享查询线程，默认1）')
+    args = parser.parse_args()
+
+    job_queue = JobQueue(visibility_timeout=args.visibility_timeout)
+    if args.threads <= 1:
+        worker = Worker(job_queue, upload_folder=args.upload_folder, poll_interval=args.poll_interval)
+        try:
+            worker.run(once=args.once)
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，工作进程退出")
+    else:
+        threads = []
+        stop_event = threading.Event()
+        for _ in range(args.threads):
+            worker = Worker(job_queue, upload_folder=args.upload_folder, poll_interval=args.poll_interval)
+            thread = threading.Thread(target=worker.run, args=(stop_event, args.once), daemon=True)
+            thread.start()
+            threads.append(thread)
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，工作进程退出")
+            stop_event.set()
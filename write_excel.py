@@ -1,6 +1,9 @@
 import openpyxl
 import logging
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 
 # 配置日志
@@ -29,7 +32,7 @@ console_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
-def read_excel_data(excel_path, sheet_name, header_name, max_search_rows=10, return_header_info=False):
+def read_excel_data(excel_path, sheet_name, header_name, max_search_rows=10, return_header_info=False, workbook=None):
     """
     读取Excel文件中指定表头列的数据
     
@@ -39,13 +42,15 @@ def read_excel_data(excel_path, sheet_name, header_name, max_search_rows=10, ret
         header_name: 表头名称
         max_search_rows: 最大搜索行数，用于查找表头
         return_header_info: 是否返回表头信息
+        workbook: 已加载的工作簿（提供时不再读取文件）
     """
     logger.info(f"开始读取Excel文件: {excel_path}, 工作表: {sheet_name}, 表头: {header_name}")
     
     try:
         # 加载Excel文件
-        workbook = openpyxl.load_workbook(excel_path)
-        logger.info(f"成功加载Excel文件: {excel_path}")
+        if workbook is None:
+            workbook = openpyxl.load_workbook(excel_path)
+            logger.info(f"成功加载Excel文件: {excel_path}")
         
         # 检查工作表是否存在
         if sheet_name not in workbook.sheetnames:
@@ -275,6 +280,149 @@ def write_multiple_columns(excel_path, sheet_name, columns_data, max_search_rows
         logger.error(error_msg, exc_info=True)
         return {'status': 'error', 'message': error_msg}
 
+class IncrementalExcelWriter:
+    """
+    流水线写入Excel：查询结果逐行放入队列，由后台线程写入已加载的工作簿，
+    每 save_every_rows 行或 save_every_seconds 秒保存一次部分结果文件
+
+    参数:
+        excel_path: Excel文件路径（全部完成后保存到此文件）
+        sheet_name: 工作表名称
+        headers: 结果列名列表（不存在时在表头行末尾创建）
+        header_row: 表头行号，第 index 条数据写入 header_row + 1 + index 行
+        partial_path: 部分结果文件路径，为None时不保存部分结果
+        on_partial_save: 每次保存部分结果后的回调，参数为 (部分结果路径, 已写入行数)
+        workbook: 已加载的工作簿（例如读取产品编号时加载的），提供时不再重新读取文件
+    """
+
+    def __init__(self, excel_path, sheet_name, headers, header_row, partial_path=None,
+                 save_every_rows=500, save_every_seconds=60, on_partial_save=None, workbook=None):
+        self.excel_path = excel_path
+        self.partial_path = partial_path
+        self.save_every_rows = save_every_rows
+        self.save_every_seconds = save_every_seconds
+        self.on_partial_save = on_partial_save
+        self.rows_written = 0
+        self.error = None
+        self._aborted = False
+
+        self.workbook = workbook if workbook is not None else openpyxl.load_workbook(excel_path)
+        if sheet_name not in self.workbook.sheetnames:
+            raise Exception(f"工作表 '{sheet_name}' 不存在")
+        self.sheet = self.workbook[sheet_name]
+        self.start_row = header_row + 1
+
+        # 查找或创建结果列
+        self.columns = []
+        for header_name in headers:
+            header_column = None
+            for cell in self.sheet[header_row]:
+                if cell.value == header_name:
+                    header_column = cell.column
+                    break
+            if not header_column:
+                header_column = self.sheet.max_column + 1
+                self.sheet.cell(row=header_row, column=header_column, value=header_name)
+                logger.info(f"创建新表头 '{header_name}' 在第 {header_row} 行第 {header_column} 列")
+            self.columns.append(header_column)
+
+        # 限制队列长度，写入跟不上时让查询端等待，避免积压占用内存
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"流水线写入已启动: {excel_path}, 工作表: {sheet_name}, 列数: {len(headers)}")
+
+    def put(self, index, values):
+        """提交第 index 条数据的结果（与 headers 顺序一致的值列表）"""
+        if self.error:
+            raise Exception(f"写入Excel失败: {self.error}")
+        self._queue.put((index, values))
+
+    def _save_partial(self):
+        # 先写入临时文件再替换，下载部分结果时不会读到写了一半的文件
+        tmp_path = self.partial_path + '.tmp'
+        try:
+            self.workbook.save(tmp_path)
+            os.replace(tmp_path, self.partial_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"已保存部分结果 ({self.rows_written} 行): {self.partial_path}")
+        if self.on_partial_save:
+            self.on_partial_save(self.partial_path, self.rows_written)
+
+    def _run(self):
+        last_save = time.time()
+        unsaved = 0
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                # 一次取出队列中已完成的所有行，批量写入
+                batch = [item]
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+                if self._aborted:
+                    break
+
+                for index, values in batch:
+                    row_num = self.start_row + index
+                    for column, value in zip(self.columns, values):
+                        self.sheet.cell(row=row_num, column=column, value=value)
+                self.rows_written += len(batch)
+                unsaved += len(batch)
+
+                if self.partial_path and (unsaved >= self.save_every_rows or time.time() - last_save >= self.save_every_seconds):
+                    try:
+                        self._save_partial()
+                    except Exception as e:
+                        # 部分结果只是进度快照（文件可能正被Excel打开或磁盘已满），失败不影响最终保存
+                        logger.warning(f"保存部分结果失败，继续写入: {e}")
+                    last_save = time.time()
+                    unsaved = 0
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"流水线写入Excel时发生错误: {e}", exc_info=True)
+            # 清空队列，避免查询端阻塞在 put()
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def abort(self):
+        """停止后台写入，不保存部分结果和最终文件"""
+        self._aborted = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def close(self):
+        """等待所有行写入并保存最终文件，返回结果字典"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error:
+            return {'status': 'error', 'message': f"写入Excel文件时发生错误: {self.error}"}
+        try:
+            self.workbook.save(self.excel_path)
+            logger.info(f"成功保存Excel文件: {self.excel_path}")
+        except Exception as e:
+            logger.error(f"保存Excel文件时发生错误: {e}", exc_info=True)
+            return {'status': 'error', 'message': f"保存Excel文件时发生错误: {str(e)}"}
+        if self.partial_path and os.path.exists(self.partial_path):
+            try:
+                os.remove(self.partial_path)
+            except OSError as e:
+                logger.warning(f"删除部分结果文件失败: {e}")
+        return {'status': 'success', 'message': f"成功写入 {self.rows_written} 行数据到Excel文件"}
+
 if __name__ == '__main__':
     # 示例用法 - 读取数据
     excel_path = input("请输入Excel文件路径: ")
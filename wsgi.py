@@ -0,0 +1,13 @@
+"""
+生产环境WSGI入口
+
+任务状态、进度和结果保存在共享的SQLite存储中，可以使用多进程WSGI服务器运行，例如:
+    gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+    waitress-serve --port=5000 wsgi:app   (Windows)
+
+注意不要使用 gunicorn 的 --preload 参数，内嵌工作线程需要在每个工作进程中各自启动。
+"""
+from web import app
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)